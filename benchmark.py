@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+"""
+benchmark.py  part of motion-track
+Offline benchmark of the motion-track detection pipeline.
+
+Drives the same MotionDetector that motion-track.py uses with frames
+from recorded video files or generated moving blob sequences, so no
+camera or pigpio daemon is needed.  The stepper is replaced by a stub
+that only counts detections.  Every combination of the resolutions and
+settings given is timed and the fps, per frame latency percentiles and
+detections per second are reported.  Results are written as JSON so
+runs from different releases can be compared.
+
+Examples
+
+    ./benchmark.py
+    ./benchmark.py --video clip1.avi --resolutions 320x240,640x480
+    ./benchmark.py --blur 5,10 --threshold 15,25 --dilate 1,2 -o bench.json
+    ./benchmark.py --compare bench.json
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import logging
+import platform
+import sys
+import time
+
+import numpy as np
+import cv2
+
+from motion_detector import MotionDetector
+try:
+    import config  # use the motion-track settings as defaults
+except ImportError:
+    config = None
+
+try:
+    from time import perf_counter as timer
+except ImportError:
+    timer = time.time  # python2
+
+PROG_VER = "version 1.0"
+
+#------------------------------------------------------------------------------
+def config_value(name, default):
+    """ return a config.py setting or default if it is not there """
+    return getattr(config, name, default)
+
+
+def int_list(text):
+    """ argparse type for a comma separated list of integers """
+    return [int(value) for value in text.split(",")]
+
+
+def float_list(text):
+    """ argparse type for a comma separated list of floats """
+    return [float(value) for value in text.split(",")]
+
+
+def resolution_list(text):
+    """ argparse type for a comma separated list of WxH resolutions """
+    resolutions = []
+    for value in text.split(","):
+        width, height = value.lower().split("x")
+        resolutions.append((int(width), int(height)))
+    return resolutions
+
+#------------------------------------------------------------------------------
+def synthetic_frames(resolution, count, blobs=2, seed=1):
+    """
+    Generate count gray frames of a textured background with sensor noise
+    and blobs bouncing around it.  The same seed gives the same frames.
+    """
+    rng = np.random.RandomState(seed)
+    width, height = resolution
+    background = rng.randint(40, 90, size=(height, width)).astype(np.uint8)
+    background = cv2.blur(background, (5, 5))
+    noise = [rng.randint(0, 8, size=(height, width)).astype(np.uint8)
+             for i in range(4)]
+    radius = max(4, min(width, height) // 12)
+    pos = rng.uniform([radius, radius], [width - radius, height - radius],
+                      size=(blobs, 2))
+    vel = rng.uniform(-1, 1, size=(blobs, 2)) * max(2, width // 80)
+    for i in range(count):
+        frame = cv2.add(background, noise[i % len(noise)])
+        for x, y in pos:
+            cv2.circle(frame, (int(x), int(y)), radius, 220, -1)
+        pos += vel
+        # bounce off the frame edges
+        for axis, limit in ((0, width), (1, height)):
+            out = (pos[:, axis] < radius) | (pos[:, axis] > limit - radius)
+            vel[out, axis] *= -1
+            pos[:, axis] = np.clip(pos[:, axis], radius, limit - radius)
+        yield frame
+
+
+def video_frames(path, resolution, count):
+    """ read up to count frames of a video file as gray frames """
+    video = cv2.VideoCapture(path)
+    try:
+        for i in range(count):
+            grabbed, frame = video.read()
+            if not grabbed:
+                break
+            frame = cv2.resize(frame, resolution, interpolation=cv2.INTER_AREA)
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    finally:
+        video.release()
+
+
+def percentile(values, percent):
+    """ return the percent percentile of a sorted list """
+    if not values:
+        return 0.0
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+#------------------------------------------------------------------------------
+def run_case(frames, resolution, settings):
+    """
+    Time MotionDetector.detect() over frames.  Only the detection is
+    timed, frame generation or decoding is not.  Returns a result dict.
+    """
+    detector = MotionDetector(resolution, **settings)
+    latencies = []
+    detections = 0
+    moves = []  # stub for the stepper, collects the motion centres
+    for gray in frames:
+        start = timer()
+        total_contours, motion_box, biggest_area = detector.detect(gray)
+        latencies.append(timer() - start)
+        if motion_box is not None:
+            (x, y, w, h) = motion_box
+            moves.append((int(x+w/2), int(y+h/2)))
+            detections += 1
+    latencies = sorted(latencies[1:])  # first frame only primes the detector
+    elapsed = sum(latencies)
+    result = dict(settings)
+    result.update({
+        "resolution": "%ix%i" % resolution,
+        "frames": len(latencies),
+        "fps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": dict((name, round(percentile(latencies, pct) * 1000, 3))
+                           for name, pct in (("p50", 50), ("p95", 95),
+                                             ("p99", 99), ("max", 100))),
+        "detections": detections,
+        "detections_per_sec": round(detections / elapsed, 2) if elapsed else 0.0,
+    })
+    return result
+
+
+def case_key(result):
+    """ the settings that identify a benchmark case across runs """
+    return (result["source"], result["resolution"], result["blur_size"],
+            result["threshold"], result["dilate_iterations"],
+            result["detect_scale"], result["method"],
+            result.get("gate_level", 0))
+
+
+def compare(results, baseline_path, tolerance):
+    """ log cases slower than the baseline file and return how many """
+    with open(baseline_path) as f:
+        baseline = dict((case_key(r), r) for r in json.load(f)["results"])
+    regressions = 0
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None or not old["fps"]:
+            continue
+        change = (result["fps"] - old["fps"]) / old["fps"]
+        if change < -tolerance:
+            regressions += 1
+            logging.warning("REGRESSION %s %.2f fps was %.2f (%+.0f%%)",
+                            case_key(result), result["fps"], old["fps"],
+                            change * 100)
+    return regressions
+
+#------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark of the motion-track detection pipeline")
+    parser.add_argument("--video", action="append", default=[],
+                        help="video file to replay, may be repeated."
+                             " Default is synthetic moving blobs")
+    parser.add_argument("--frames", type=int, default=300,
+                        help="frames per case (default 300)")
+    parser.add_argument("--blobs", type=int, default=2,
+                        help="moving blobs in synthetic frames (default 2)")
+    parser.add_argument("--resolutions", type=resolution_list,
+                        default=[(320, 240), (640, 480)])
+    parser.add_argument("--blur", type=int_list,
+                        default=[config_value("BLUR_SIZE", 10)])
+    parser.add_argument("--threshold", type=int_list,
+                        default=[config_value("THRESHOLD_SENSITIVITY", 25)])
+    parser.add_argument("--dilate", type=int_list,
+                        default=[config_value("DILATE_ITERATIONS", 2)])
+    parser.add_argument("--scale", type=float_list,
+                        default=[config_value("DETECT_SCALE", 1.0)])
+    parser.add_argument("--method", type=lambda text: text.split(","),
+                        default=[config_value("DETECT_METHOD", "contours")])
+    parser.add_argument("--gate", type=float_list,
+                        default=[config_value("GATE_LEVEL", 0)],
+                        help="fraction of gate pixels that must change to"
+                             " run the full detection, 0=off")
+    parser.add_argument("--min-area", type=int,
+                        default=config_value("MIN_AREA", 200))
+    parser.add_argument("-o", "--output",
+                        help="write JSON results to this file (default stdout)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="JSON results of an earlier run. Exit 1 if any"
+                             " case is slower by more than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed fps drop against --compare (default 0.10)")
+    args = parser.parse_args()
+
+    sources = args.video or ["synthetic"]
+    results = []
+    for source, resolution, blur, threshold, dilate, scale, method, gate in \
+            itertools.product(sources, args.resolutions, args.blur,
+                              args.threshold, args.dilate, args.scale,
+                              args.method, args.gate):
+        if source == "synthetic":
+            frames = synthetic_frames(resolution, args.frames, args.blobs)
+        else:
+            frames = video_frames(source, resolution, args.frames)
+        settings = {"detect_scale": scale, "blur_size": blur,
+                    "threshold": threshold, "min_area": args.min_area,
+                    "dilate_iterations": dilate, "method": method,
+                    "gate_level": gate,
+                    "gate_scale": config_value("GATE_SCALE", 0.125),
+                    "gate_force": config_value("GATE_FORCE_FRAMES", 25)}
+        result = run_case(frames, resolution, settings)
+        result["source"] = source
+        logging.info("%s %s blur=%i thresh=%i dilate=%i scale=%.2f %s"
+                     " gate=%g %.1f fps p50=%.2fms p99=%.2fms %.1f det/s",
+                     source, result["resolution"], blur, threshold, dilate,
+                     scale, method, gate, result["fps"],
+                     result["latency_ms"]["p50"], result["latency_ms"]["p99"],
+                     result["detections_per_sec"])
+        results.append(result)
+
+    report = {
+        "benchmark": "motion-track detection",
+        "version": PROG_VER,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        logging.info("Results saved to %s", args.output)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print("")
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-8s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    main()
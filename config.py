@@ -4,7 +4,11 @@
 # ----------------
 debug = True        # Set to False for no data display
 window_on = False   # Set to True displays opencv windows (GUI desktop reqd)
-show_fps = False    # Show Frames per second
+show_fps = False    # Show Frames per second and per stage timings every FRAME_COUNTER frames
+LOG_SUMMARY_SEC = 5.0  # debug logs detections per second and the last one this often  0=log every frame
+LOG_REPEAT_SEC = 10.0  # the same warning is logged at most once this many seconds  0=no limit
+LOG_QUEUE = 1000    # log records waiting for the log writer thread, more are dropped
+LOG_FILE = None     # eg "motion-track.log" also write the log to this file  None=off
 
 # OpenCV Settings
 # ---------------
@@ -16,6 +20,10 @@ LINE_THICKNESS = 2  # thickness of bounding line in pixels
 WINDOW_BIGGER = 2   # Resize multiplier for Movement Status Window
                     # if gui_window_on=True then makes opencv window bigger
                     # Note if the window is larger than 1 then a reduced frame rate will occur
+STREAM_PORT = 0     # eg 8080 serve the tracking views as MJPEG on http://STREAM_HOST:PORT/  0=off
+STREAM_HOST = "127.0.0.1"  # "0.0.0.0" to allow viewers on other computers
+STREAM_FPS = 5      # most frames per second encoded for MJPEG viewers
+STREAM_QUALITY = 70 # MJPEG JPEG quality 0-100
 
 # Camera Settings
 # ---------------
@@ -35,10 +43,86 @@ CAMERA_HFLIP = True   # True=flip camera image horizontally
 CAMERA_VFLIP = True   # True=flip camera image vertically
 CAMERA_ROTATION = 0   # Rotate camera image valid values 0, 90, 180, 270
 CAMERA_FRAMERATE = 25 # default = 25 lower for USB Web Cam. Try different settings
+CAMERA_LUMA = True    # True=capture yuv and detect on the Y plane only, BGR made only for windows
+LUMA_BUFFERS = 4      # number of reusable yuv frame buffers when CAMERA_LUMA=True (at least 4)
 FRAME_COUNTER = 1000  # used when show_fps=True  Sets frequency of display
+PIPELINE_MODE = False # True=run capture and detection in separate processes (multi core RPI)
+PIPELINE_SLOTS = 6    # shared memory frame slots when PIPELINE_MODE=True
+FRAME_TIMEOUT = 2.0   # seconds track() waits for a new camera frame before warning
+
+# Video File Settings
+FILE_SOURCE = None    # None=camera. Path to a video, image or directory of them to analyse instead
+FILE_MAX_SPEED = True # True=process file frames as fast as possible False=play at the file frame rate
+FILE_PREFETCH = 64    # frames decoded ahead of detection when FILE_SOURCE is set
 
 # Motion Track Settings
 # ---------------------
 MIN_AREA = 200       # excludes all contours less than or equal to this Area
+DETECT_SCALE = 1.0   # default = 1.0 run detection on images scaled by this factor eg. 0.5
+                     # for larger camera resolutions. MIN_AREA and BLUR_SIZE are rescaled to match
 THRESHOLD_SENSITIVITY = 25
 BLUR_SIZE = 10
+DILATE_ITERATIONS = 2  # number of times the threshold image is dilated to join up motion blobs
+DETECT_ROIS = []     # list of (x, y, w, h) frame rectangles to watch eg. [(0, 40, 320, 160)]  []=whole frame
+EXCLUDE_POLYGONS = []  # list of [(x, y), ...] frame polygons to ignore eg. trees or monitors
+MASK_IMAGE = None    # path to a mask image, black pixels are ignored  None=no mask image
+DETECT_METHOD = "contours"  # "contours"=findContours loop  "components"=single pass connectedComponentsWithStats (OpenCV3+)
+GATE_LEVEL = 0       # 0=off. Run the full detection only if this fraction (eg. 0.002) of a small GATE_SCALE image changed, masked out pixels not counted
+GATE_SCALE = 0.125   # size of the gate image compared to the detection image
+GATE_FORCE_FRAMES = 25  # run the full detection at least every this many frames when GATE_LEVEL is on
+BLACK_FRAME_LEVEL = 0.5    # mean pixel brightness (0-255) below which a frame is black eg. lens cap
+BLACK_FRAME_STEP = 8       # sample every Nth pixel row and column when checking for black frames
+BLACK_FRAME_ZERO_SEC = 3   # seconds of black frames before the stepper returns to zero
+READY_TIMEOUT = 5.0        # most seconds to wait at startup for the camera exposure to settle
+READY_SETTLE_FRAMES = 3    # frames in a row that must be steady before tracking starts
+READY_LEVEL_CHANGE = 2.0   # mean brightness change (0-255) between frames still counted as steady
+WATCHDOG_STALL_SEC = 3.0   # reopen the camera after this many seconds without a frame  0=off
+WATCHDOG_FROZEN_FRAMES = 30   # reopen the camera after this many identical frames in a row
+WATCHDOG_INVALID_FRAMES = 30  # reopen the camera after this many failed reads in a row
+WATCHDOG_BACKOFF = 0.5     # seconds before retrying a failed reopen, doubled each failure
+WATCHDOG_BACKOFF_MAX = 30.0  # longest wait between reopen attempts
+EGO_MOTION = False     # True=line frames up by the stepper pan so motion is still detected while panning
+EGO_MAX_CHANGE = 0.2   # if more than this fraction of the image still changes, measure the pan from the images
+
+# Object Tracking Settings
+# ------------------------
+TRACK_OBJECTS = False    # True=follow one tracked object instead of the largest motion in each frame
+TRACK_MAX_OBJECTS = 8    # most moving blobs per frame passed to the tracker
+TRACK_MAX_DISTANCE = 50  # pixels a blob can be from an object's predicted position and still match it
+TRACK_MAX_MISSED = 10    # frames an object can go undetected before it is forgotten
+TRACK_MIN_HITS = 3       # frames an object must be seen in before it can be followed
+TRACK_LEAD_SEC = 0.1     # seconds from a stepper command to the platform moving, aim this far ahead
+
+# Stepper Settings
+# ----------------
+STEPPER_POLL_SEC = 0.02    # how often the stepper thread checks for a new target during a move
+STEPPER_SETTLE_SEC = 0.25  # pause after a completed move to let the platform settle
+STEPPER_MIN_FREQ = 250     # steps per second a move starts and ends at
+STEPPER_MAX_FREQ = 2000    # fastest steps per second for long moves
+STEPPER_ACCEL = 2500       # steps per second per second
+STEPPER_RAMP_LEVELS = 12   # frequency levels between STEPPER_MIN_FREQ and STEPPER_MAX_FREQ
+STEPPER_PROFILE = "scurve" # "scurve"=ease in and out of acceleration  "trapezoid"=constant acceleration
+
+# Stage Timing Settings
+# ---------------------
+STAGE_TIMING = False   # True=time each processing stage (always on if show_fps=True)
+METRICS_WINDOW = 1000  # number of recent samples per stage used for p50/p95/p99
+METRICS_FILE = None    # eg "metrics.json" write stage timings to this file  None=off
+METRICS_INTERVAL = 10  # seconds between METRICS_FILE updates
+METRICS_PORT = 0       # eg 9100 serve Prometheus text on http://127.0.0.1:PORT/metrics  0=off
+LATENCY_TRACE = False  # True=log capture to detect to stepper wave start latencies every FRAME_COUNTER frames
+LATENCY_TRACE_FILE = None  # eg "latency.jsonl" append a JSON line per frame for later analysis  None=off
+
+# Motion Event Settings
+# ---------------------
+EVENT_SINKS = []       # eg ["jsonl:events.jsonl", "udp:127.0.0.1:5005", "unix:/tmp/motion-track.sock", "python:module:function"]  []=off
+EVENT_QUEUE = 1000     # events held for slow sinks, more are dropped so tracking never waits
+EVENT_BATCH = 50       # most events handed to a sink at once
+
+# Rate Control Settings
+# ---------------------
+RATE_CONTROL = False    # True=lower quality in steps when frames fall behind LATENCY_BUDGET
+LATENCY_BUDGET = 0.15   # seconds allowed from frame capture to the end of processing it
+RATE_RESTORE = 0.6      # raise quality again once latency is under this fraction of the budget
+RATE_HOLD_SEC = 3.0     # minimum seconds between quality changes
+RATE_DETECT_SCALE = 0.5 # DETECT_SCALE used at the lowest quality step
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+"""
+display_worker.py  part of motion-track
+Draw and show the tracking windows on a thread of their own.
+
+The tracking loop hands DisplayWorker its latest frame with a list of
+overlay primitives and carries on.  The worker copies nothing it does
+not need, draws the overlays, resizes, feeds any MJPEG viewers and runs
+cv2.imshow and cv2.waitKey, so turning the windows on no longer slows
+detection.  A frame offered while the worker is still busy with the
+last one is dropped.  Pressing q in a window sets quit for the loop.
+
+Overlays are (name, args) tuples where name is one of DRAW and args
+are the arguments after the image eg. ("circle", ((x, y), 3, color, 2)).
+"""
+
+import logging
+import threading
+import numpy as np
+import cv2
+
+DRAW = {"circle": cv2.circle,
+        "rectangle": cv2.rectangle,
+        "line": cv2.line,
+        "text": cv2.putText}
+
+#------------------------------------------------------------------------------
+def draw_overlays(image, overlays):
+    """ draw (name, args) overlay primitives onto image """
+    for name, args in overlays:
+        DRAW[name](image, *args)
+
+
+class NullDisplay(object):
+    """ DisplayWorker stand in used when there are no windows or viewers """
+    enabled = False
+    quit = False
+    window_bigger = 1
+
+    def wanted(self):
+        return False
+
+    def ready(self):
+        return False
+
+    def show(self, image, overlays=(), difference_image=None,
+             threshold_image=None):
+        return False
+
+    def stop(self):
+        pass
+
+
+class DisplayWorker(object):
+    """
+    Show frames in opencv windows named title and publish them to
+    streamer, see mjpeg_stream.py, from a worker thread.  windows=False
+    only feeds the streamer.  show_difference and show_threshold turn
+    the extra windows on.  window_bigger resizes the main window and may
+    be changed at any time.
+    """
+    enabled = True
+
+    def __init__(self, title, windows=True, window_bigger=1,
+                 show_difference=False, show_threshold=False, streamer=None):
+        self.title = title
+        self.windows = windows
+        self.window_bigger = window_bigger
+        self.show_difference = show_difference
+        self.show_threshold = show_threshold
+        self.streamer = streamer
+        self.incoming = {}     # view: buffer show() copies into
+        self.showing = {}      # view: buffer the worker is drawing
+        self.overlays = []
+        self.pending = False   # True while incoming waits for the worker
+        self.shown = 0
+        self.dropped = 0
+        self.quit = False
+        self.stopped = False
+        self.frame_ready = threading.Condition(threading.Lock())
+
+    def start(self):
+        """ start the thread that owns the windows """
+        t = threading.Thread(target=self.update, args=())
+        t.daemon = True
+        t.start()
+        return self
+
+    def wanted(self):
+        """ return True if windows or MJPEG viewers need frames """
+        return self.windows or (self.streamer is not None and
+                                self.streamer.watched())
+
+    def ready(self):
+        """ return True if show() would take a frame now """
+        return not self.pending
+
+    def show(self, image, overlays=(), difference_image=None,
+             threshold_image=None):
+        """
+        Offer a BGR frame, the overlays to draw on it and the optional
+        difference and threshold images.  They are copied, so the caller
+        can reuse them, unless the worker has not taken the last frame in
+        which case they are dropped and False is returned.
+        """
+        with self.frame_ready:
+            if self.pending:
+                self.dropped += 1
+                return False
+            self.copy("frame", image)
+            self.copy("difference", difference_image)
+            self.copy("threshold", threshold_image)
+            self.overlays = list(overlays)
+            self.pending = True
+            self.frame_ready.notify()
+        return True
+
+    def copy(self, view, image):
+        """ copy image into the incoming buffer for view """
+        if image is None:
+            self.incoming.pop(view, None)
+            return
+        buf = self.incoming.get(view)
+        if buf is None or buf.shape != image.shape:
+            buf = self.incoming[view] = np.empty_like(image)
+        np.copyto(buf, image)
+
+    def update(self):
+        """ draw and show frames until stopped or q is pressed """
+        while not self.stopped:
+            with self.frame_ready:
+                if not self.pending:
+                    # wake up regularly so the windows stay responsive
+                    self.frame_ready.wait(0.05)
+                if self.pending:
+                    self.incoming, self.showing = self.showing, self.incoming
+                    overlays = self.overlays
+                    self.pending = False
+                else:
+                    overlays = None
+            if overlays is not None:
+                self.render(overlays)
+            if self.windows and cv2.waitKey(1) & 0xFF == ord('q'):
+                logging.info("q pressed in window")
+                cv2.destroyAllWindows()
+                self.quit = True
+                self.windows = False
+        if self.windows:
+            cv2.destroyAllWindows()
+
+    def render(self, overlays):
+        """ draw the overlays on the frame being shown and display it """
+        image = self.showing["frame"]
+        difference_image = self.showing.get("difference")
+        threshold_image = self.showing.get("threshold")
+        draw_overlays(image, overlays)
+        self.shown += 1
+        if self.streamer is not None:
+            self.streamer.publish(image, difference_image, threshold_image)
+        if not self.windows:
+            return
+        if self.show_difference and difference_image is not None:
+            cv2.imshow('Difference Image', difference_image)
+        if self.show_threshold and threshold_image is not None:
+            cv2.imshow('OpenCV Threshold', threshold_image)
+        # Note setting a bigger window will slow the display, not tracking
+        if self.window_bigger > 1:
+            height, width = image.shape[:2]
+            image = cv2.resize(image, (int(width * self.window_bigger),
+                                       int(height * self.window_bigger)))
+        cv2.imshow(self.title, image)
+
+    def stop(self):
+        """ indicate that the thread should be stopped """
+        self.stopped = True
+
+
+def make_display(title, windows=True, window_bigger=1, show_difference=False,
+                 show_threshold=False, streamer=None):
+    """
+    Return a started DisplayWorker, or a NullDisplay if there are no
+    windows and no streamer
+    """
+    if not windows and (streamer is None or not streamer.enabled):
+        return NullDisplay()
+    return DisplayWorker(title, windows, window_bigger, show_difference,
+                         show_threshold, streamer).start()
@@ -29,6 +29,7 @@ print("%s using python2 and OpenCV2" % (progname))
 print("Loading Please Wait ....")
 
 import os
+import sys
 import time
 from picamera import PiCamera
 from picamera.array import PiRGBArray
@@ -37,6 +38,11 @@ import numpy as np
 from threading import Thread
 from random import randint
 
+# motion_detector.py is in the motion-track folder above this one
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from motion_detector import MotionDetector
+from display_worker import make_display
+
 # Display Settings
 window_on = True       # Set to True displays opencv windows (GUI desktop reqd)
 WINDOW_BIGGER = 1.5    # resize multiplier if window_on=True then makes opencv window bigger
@@ -76,8 +82,6 @@ CIRCLE_SIZE = 8      # diameter of circle to show motion location in window
 CIRCLE_LINE = 3      # thickness of line for circle
 FONT_SCALE = .5      # OpenCV window text font size scaling factor default=.5 (lower is smaller)
 LINE_THICKNESS = 2   # thickness of bounding line in pixels
-big_w = int(CAMERA_WIDTH * WINDOW_BIGGER)
-big_h = int(CAMERA_HEIGHT * WINDOW_BIGGER)
 
 #-----------------------------------------------------------------------------------------------  
 class PiVideoStream:    # Video Stream using Treading
@@ -207,48 +211,42 @@ def hotspot_game():
     playgame = False
     endgame = False
     
+    # The game window is resized and shown on its own thread
+    display = make_display('HOTSPOT GAME q in Window to Quit', window_on,
+                           WINDOW_BIGGER)
+    # Motion detection buffers are allocated once and reused every frame
+    detector = MotionDetector((CAMERA_WIDTH, CAMERA_HEIGHT),
+                              blur_size=BLUR_SIZE,
+                              threshold=THRESHOLD_SENSITIVITY,
+                              min_area=MIN_AREA, dilate_iterations=0)
     # Initialize first image as stream.array   
     image2 = vs.read() 
-    grayimage1 = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
+    detector.reset(image2)
     while not end_of_game:
         # initialize variables               
         image2 = vs.read()  # Initialize second image   
-        # Convert image to gray scale for start of motion tracking
-        grayimage2 = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
-        # Get differences between the two greyed, blurred images
-        differenceimage = cv2.absdiff(grayimage1, grayimage2)
-        grayimage1 = grayimage2   # Update grayimage1 for next iteration
-        differenceimage = cv2.blur(differenceimage,(BLUR_SIZE,BLUR_SIZE))
-        # Get threshold of difference image based on THRESHOLD_SENSITIVITY variable
-        retval, thresholdimage = cv2.threshold(differenceimage,THRESHOLD_SENSITIVITY,255,cv2.THRESH_BINARY)
-        # Get all the contours found in the thresholdimage
-        contours, hierarchy = cv2.findContours(thresholdimage,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_SIMPLE)
-        total_contours = len(contours)
-
+        # menus need a bigger motion than game play
         if playgame:
             biggest_area = MIN_AREA
         else:
             biggest_area = 4000        
+        # find the biggest moving contour against the last image
+        (total_contours, motion_box,
+         found_area) = detector.detect(image2, biggest_area)
 
         motion_found = False
         cx = -1
         cy = -1
         cw = -1
         ch = -1
-        found_area = 0   
-        # find contour with biggest area             
-        for c in contours:
-            # get area of next contour
-            found_area = cv2.contourArea(c)
-            # find the middle of largest bounding rectangle
-            if found_area > biggest_area:
-                motion_found = True
-                biggest_area = found_area
-                (x, y, w, h) = cv2.boundingRect(c)
-                cx = x + w/2   # put circle in middle of width
-                cy = y + h/2   # put circle closer to top
-                cw = w
-                ch = h
+        if motion_box is not None:
+            motion_found = True
+            biggest_area = found_area
+            (x, y, w, h) = motion_box
+            cx = x + w/2   # put circle in middle of width
+            cy = y + h/2   # put circle closer to top
+            cw = w
+            ch = h
         
         if window_on:
             if begingame:   # Pick Players 
@@ -406,23 +404,18 @@ def hotspot_game():
                  m_text = "%s SCORE %i  LEVEL %i  HI SCORE %i  "  % ( player, hotspot_score, hotspot_level, hotspot_hiscore)
                  cv2.putText(image2, m_text, ( 2, 20), cv2.FONT_HERSHEY_SIMPLEX, .75 , (0,255,0), 2)       
                 
-            if WINDOW_BIGGER > 1:
-                # resize motion window to desired size
-                image2 = cv2.resize(image2, (big_w, big_h))
-                cv2.imshow('HOTSPOT GAME q in Window to Quit', image2)  # bigger size                        
-            else:
-                # display original image size motion window 
-                cv2.imshow('HOTSPOT BAME q in Window to Quit', image2) # original size
-                # cv2.imshow('Threshold Image', thresholdimage)
-                # cv2.imshow('Difference Image',differenceimage           
-                      
-            if cv2.waitKey(1) & 0xFF == ord('q'):   # Close Window if q pressed   
-                cv2.destroyAllWindows()
+            # display worker copies image2, resizes it by WINDOW_BIGGER and
+            # drops it if it is still showing the last one
+            display.show(image2)
+
+            if display.quit:   # Close Window if q pressed   
                 print("")
                 print("ctrl-q pressed End %s"  % (progname))
                 vs.stop() 
                 end_of_game = True
             
+        if end_of_game:
+            display.stop()
         if debug:
             if motion_found:
                 print("total_Contours=%2i  Motion at cx=%3i cy=%3i  Area:%3ix%3i=%5i" % (total_contours, cx ,cy, cw, ch, cw*ch))                      
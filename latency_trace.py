@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""
+latency_trace.py  part of motion-track
+End to end latency tracing from camera capture to stepper wave start.
+
+Each frame carries the monotonic time it was captured.  LatencyTracer
+records how long it took to detect motion in it, to hand the target to
+the stepper controller and to start transmitting the stepper waves,
+along with how many frames and stepper targets were dropped or
+superseded on the way.  A rolling summary is logged every log_every
+frames and every frame can be written as a JSON line to a trace file.
+"""
+
+import json
+import logging
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # python2
+
+from stage_timer import StageTimer
+
+#------------------------------------------------------------------------------
+class NullTracer(object):
+    """ LatencyTracer stand in used when tracing is off """
+    enabled = False
+
+    def frame_detected(self, frame_seq, capture_time, detect_time,
+                       frames_dropped=0):
+        pass
+
+    def motor_started(self, trace, command_time, wave_time):
+        pass
+
+    def superseded(self, count=1):
+        pass
+
+    def close(self):
+        pass
+
+
+class LatencyTracer(object):
+    """
+    Collect capture->detect, detect->command and command->wave latencies.
+    Trace lines are written by a background thread from a bounded queue
+    so a slow disk never holds up the caller, lines are counted and
+    dropped if the queue is full.
+    """
+    enabled = True
+
+    def __init__(self, trace_path=None, window=1000, log_every=1000):
+        self.latencies = StageTimer(window)
+        self.log_every = log_every
+        self.frames = 0
+        self.frames_dropped = 0
+        self.targets_superseded = 0
+        self.lines_lost = 0
+        self.lines = None
+        self.trace_file = None
+        self.writer = None
+        if trace_path:
+            self.trace_file = open(trace_path, "a")
+            self.lines = queue.Queue(maxsize=1000)
+            self.writer = threading.Thread(target=self.update, args=())
+            self.writer.daemon = True
+            self.writer.start()
+
+    def write(self, record):
+        """ queue a trace record for the writer thread """
+        if self.lines is None:
+            return
+        try:
+            self.lines.put_nowait(record)
+        except queue.Full:
+            self.lines_lost += 1
+
+    def update(self):
+        """ write queued trace records until close() queues None """
+        while True:
+            record = self.lines.get()
+            if record is None:
+                break
+            self.trace_file.write(json.dumps(record, sort_keys=True) + "\n")
+            if self.lines.empty():
+                self.trace_file.flush()
+        self.trace_file.close()
+
+    def frame_detected(self, frame_seq, capture_time, detect_time,
+                       frames_dropped=0):
+        """
+        Record a frame that has been through detection.  frames_dropped is
+        the running total of frames the camera captured but never processed
+        """
+        self.frames += 1
+        self.frames_dropped = frames_dropped
+        self.latencies.record("capture_to_detect", detect_time - capture_time)
+        self.write({"seq": frame_seq, "capture": capture_time,
+                    "detect": detect_time})
+        if self.frames % self.log_every == 0:
+            self.log()
+
+    def motor_started(self, trace, command_time, wave_time):
+        """
+        Record the stepper controller starting a move for trace, the
+        (frame_seq, capture_time, detect_time) given to motion_detected().
+        This adds a second trace line for the frame with the motor times.
+        """
+        frame_seq, capture_time, detect_time = trace
+        self.latencies.record("detect_to_command", command_time - detect_time)
+        self.latencies.record("command_to_wave", wave_time - command_time)
+        self.latencies.record("capture_to_wave", wave_time - capture_time)
+        self.write({"seq": frame_seq, "capture": capture_time,
+                    "detect": detect_time, "command": command_time,
+                    "wave": wave_time})
+
+    def superseded(self, count=1):
+        """ count stepper targets replaced by a newer one before moving """
+        self.targets_superseded += count
+
+    def summary(self):
+        """ return the latency percentiles and drop counts as a dict """
+        return {"frames": self.frames,
+                "frames_dropped": self.frames_dropped,
+                "targets_superseded": self.targets_superseded,
+                "trace_lines_lost": self.lines_lost,
+                "latency": self.latencies.summary()}
+
+    def log(self):
+        """ log the latency percentiles in milliseconds """
+        logging.info("Latency %i frames, %i frames dropped,"
+                     " %i stepper targets superseded",
+                     self.frames, self.frames_dropped,
+                     self.targets_superseded)
+        summary = self.latencies.summary()
+        for stage in self.latencies.order:
+            if stage in summary:
+                stats = summary[stage]
+                logging.info("  %-17s p50 %7.2f  p95 %7.2f  p99 %7.2f ms",
+                             stage, stats["p50"] * 1000,
+                             stats["p95"] * 1000, stats["p99"] * 1000)
+
+    def close(self):
+        """ log a final summary and finish writing the trace file """
+        self.log()
+        if self.lines is not None:
+            try:
+                self.lines.put(None, timeout=1.0)
+            except queue.Full:
+                pass  # the disk is stuck, the join below gives up too
+            self.writer.join(5.0)
+
+
+def make_tracer(enabled, trace_path=None, window=1000, log_every=1000):
+    """ return a LatencyTracer, or a NullTracer if enabled is False """
+    if not enabled:
+        return NullTracer()
+    if trace_path:
+        logging.info("Writing latency trace to %s", trace_path)
+    return LatencyTracer(trace_path, window, log_every)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+"""
+log_queue.py  part of motion-track
+Keep logging off the tracking loop.
+
+start_logging() moves the handlers logging.basicConfig() set up, plus an
+optional log file, behind a bounded queue so a log call only queues the
+record and a listener thread formats and writes it.  Records are not
+formatted before they are queued, so log calls must pass numbers and
+strings as args, not objects that change afterwards.  If the queue is
+full the record is counted and dropped rather than waiting on a slow
+console or SD card.
+
+Warnings from the same line are let through at most once every
+repeat_sec seconds with a count of those suppressed, and FrameSummary
+collapses per frame detection lines into a rate and the latest line.
+"""
+
+import logging
+import sys
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # python2
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic  # python2 has no monotonic clock
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    # python2 has neither, these do just what is used below
+    class QueueHandler(logging.Handler):
+        """ send records to a queue for a QueueListener to handle """
+        def __init__(self, log_queue):
+            logging.Handler.__init__(self)
+            self.queue = log_queue
+
+        def enqueue(self, record):
+            self.queue.put_nowait(record)
+
+        def prepare(self, record):
+            """ format the record so it no longer needs its args """
+            record.msg = self.format(record)
+            record.args = None
+            record.exc_info = None
+            record.exc_text = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.enqueue(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        """ pass queued records to handlers from a thread """
+        _sentinel = None
+
+        def __init__(self, log_queue, *handlers):
+            self.queue = log_queue
+            self.handlers = handlers
+            self._thread = None
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor, args=())
+            self._thread.daemon = True
+            self._thread.start()
+
+        def enqueue_sentinel(self):
+            self.queue.put_nowait(self._sentinel)
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel:
+                    return
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+
+        def stop(self):
+            self.enqueue_sentinel()
+            self._thread.join()
+            self._thread = None
+
+#------------------------------------------------------------------------------
+class RepeatFilter(logging.Filter):
+    """
+    Pass a warning or error from one source line at most once every
+    repeat_sec seconds, noting how many were suppressed in between, so a
+    failing camera does not flood the log.  Info lines pass, the periodic
+    ones already have their own interval.
+    """
+    def __init__(self, repeat_sec=10.0):
+        logging.Filter.__init__(self)
+        self.repeat_sec = repeat_sec
+        self.seen = {}   # (pathname, lineno): [next time allowed, suppressed]
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = monotonic()
+        seen = self.seen.get(key)
+        if seen is None:
+            self.seen[key] = [now + self.repeat_sec, 0]
+            return True
+        if now < seen[0]:
+            seen[1] += 1
+            return False
+        if seen[1]:
+            record.msg = "%s (%i similar suppressed)" % (record.msg, seen[1])
+        seen[0] = now + self.repeat_sec
+        seen[1] = 0
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """ QueueHandler that drops records instead of waiting when full """
+    def __init__(self, log_queue):
+        QueueHandler.__init__(self, log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # leave formatting to the listener thread, only exception
+        # tracebacks must be rendered before the frame goes away
+        if record.exc_info:
+            return QueueHandler.prepare(self, record)
+        return record
+
+
+class DrainingQueueListener(QueueListener):
+    """ QueueListener whose stop() waits for room in a full queue """
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LogListener(object):
+    """ owns the QueueListener thread writing queued records to handlers """
+    def __init__(self, handler, handlers):
+        self.handler = handler
+        self.handlers = handlers
+        self.listener = DrainingQueueListener(handler.queue, *handlers)
+
+    def start(self):
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """ write the records still queued and stop the thread """
+        if self.listener is None:
+            return
+        self.listener.stop()
+        self.listener = None
+        if self.handler.dropped:
+            # the listener is gone, so this goes straight to the handlers
+            record = logging.makeLogRecord({
+                "levelno": logging.WARNING, "levelname": "WARNING",
+                "funcName": "stop",
+                "msg": "%i log records dropped, log queue full"
+                       % self.handler.dropped})
+            for handler in self.handlers:
+                handler.handle(record)
+
+#------------------------------------------------------------------------------
+def start_logging(queue_size=1000, repeat_sec=10.0, log_file=None):
+    """
+    Move the root logger's handlers, and a FileHandler for log_file, onto
+    a listener thread and return a LogListener to stop() at exit
+    """
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if log_file:
+        file_handler = logging.FileHandler(log_file)
+        if handlers:
+            file_handler.setFormatter(handlers[0].formatter)
+        handlers.append(file_handler)
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    if repeat_sec > 0:
+        handler.addFilter(RepeatFilter(repeat_sec))
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    return LogListener(handler, handlers).start()
+
+
+class FrameSummary(object):
+    """
+    Collapse a log line per frame into one line every interval seconds
+    with the number of lines and their rate while they were coming,
+    followed by the latest line.  A thread logs the summary when the
+    interval is up even if no more lines arrive, under the function that
+    called add().  interval 0 logs every line.  Each call site is one
+    summary, so give it its own FrameSummary and close() it at exit.
+    """
+    def __init__(self, what="detections", interval=5.0):
+        self.what = what
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.count = 0
+        self.first = None  # monotonic time of the first line counted
+        self.latest = None  # monotonic time of the latest line
+        self.last = None   # (message, args, caller) of the latest line
+        self.stopped = threading.Event()
+        self.ticker = None
+        if interval > 0:
+            self.ticker = threading.Thread(target=self.update, args=())
+            self.ticker.daemon = True
+            self.ticker.start()
+
+    def add(self, message, *args):
+        """ count a line for the next summary, or log it if interval is 0 """
+        if self.interval <= 0:
+            logging.info(message, *args)
+            return
+        caller_frame = sys._getframe(1)
+        caller = (caller_frame.f_code.co_filename, caller_frame.f_lineno,
+                  caller_frame.f_code.co_name)
+        now = monotonic()
+        with self.lock:
+            if not self.count:
+                self.first = now
+            self.count += 1
+            self.latest = now
+            self.last = (message, args, caller)
+
+    def update(self):
+        """ log a summary every interval seconds until close() """
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """ log the lines counted since the last summary, if any """
+        with self.lock:
+            if not self.count:
+                return
+            count = self.count
+            active = self.latest - self.first
+            message, args, caller = self.last
+            self.count = 0
+        logger = logging.getLogger()
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        if count > 1 and active > 0:
+            summary = "%i %s in %.1fs %.1f/s, last " % (
+                count, self.what, active, (count - 1) / active)
+        else:
+            summary = "%i %s, last " % (count, self.what)
+        # log as the caller of add(), not as flush() on the ticker thread
+        filename, lineno, func = caller
+        record = logger.makeRecord(logger.name, logging.INFO, filename,
+                                   lineno, summary + message, args, None,
+                                   func)
+        logger.handle(record)
+
+    def close(self):
+        """ stop the ticker and log what is still counted """
+        self.stopped.set()
+        if self.ticker is not None:
+            self.ticker.join()
+        self.flush()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""
+mjpeg_stream.py  part of motion-track
+Serve the annotated tracking frames as MJPEG over http.
+
+Lets a headless tracker be watched from a browser instead of opencv
+windows.  http://host:port/ shows the frame, difference and threshold
+views, each also available alone at /frame.mjpg, /difference.mjpg and
+/threshold.mjpg.  publish() only copies the views someone is watching,
+at most max_fps times a second, and JPEG encoding happens on a worker
+thread.  With no viewers publish() returns straight away and a slow
+viewer only ever misses frames, the tracking loop never waits on it.
+"""
+
+import logging
+import threading
+import numpy as np
+import cv2
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic  # python2 has no monotonic clock
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # python2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+VIEWS = ("frame", "difference", "threshold")
+BOUNDARY = "MOTIONTRACKFRAME"
+INDEX_PAGE = """<html><head><title>motion-track</title></head><body>
+<img src="/frame.mjpg"> <img src="/difference.mjpg"> <img src="/threshold.mjpg">
+</body></html>
+"""
+
+#------------------------------------------------------------------------------
+class NullStreamer(object):
+    """ MjpegStreamer stand in used when streaming is off """
+    enabled = False
+
+    def watched(self):
+        return False
+
+    def publish(self, frame, difference_image=None, threshold_image=None):
+        pass
+
+    def stop(self):
+        pass
+
+
+class StreamServer(ThreadingMixIn, HTTPServer):
+    """ HTTPServer with a thread per viewer """
+    daemon_threads = True
+
+
+class MjpegStreamer(object):
+    """
+    Encode published images on a worker thread and stream the latest
+    JPEG of each view to every http client watching it
+    """
+    enabled = True
+
+    def __init__(self, port, host="127.0.0.1", max_fps=5, quality=70):
+        self.interval = 1.0 / max_fps
+        self.quality = quality
+        self.clients = dict((view, 0) for view in VIEWS)
+        self.viewers = 0          # clients watching any view
+        self.buffers = {}         # view: copy of the image being encoded
+        self.pending = set()      # views copied and waiting for the worker
+        self.jpegs = dict((view, None) for view in VIEWS)
+        self.jpeg_seq = 0         # bumped each time new JPEGs are ready
+        self.next_frame = 0.0     # monotonic time the next copy is allowed
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+        self.new_jpeg = threading.Condition(threading.Lock())
+        self.stopped = False
+        streamer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0].rstrip("/")
+                if path in ("", "/index.html"):
+                    body = INDEX_PAGE.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                view = path.lstrip("/").replace(".mjpg", "")
+                if view not in VIEWS:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "multipart/x-mixed-replace; boundary=%s"
+                                 % BOUNDARY)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Pragma", "no-cache")
+                self.end_headers()
+                streamer.stream(view, self.wfile)
+
+            def log_message(self, format, *args):
+                pass  # keep viewers out of the console log
+
+        self.server = StreamServer((host, port), Handler)
+
+    def start(self):
+        """ start the http server and JPEG encoder threads """
+        for target in (self.server.serve_forever, self.update):
+            t = threading.Thread(target=target, args=())
+            t.daemon = True
+            t.start()
+        return self
+
+    def watched(self):
+        """ return True if anyone is watching, so frames are worth drawing """
+        return self.viewers > 0
+
+    def publish(self, frame, difference_image=None, threshold_image=None):
+        """
+        Offer the latest images to the viewers.  They are copied for the
+        encoder only if someone is watching, the encoder has finished the
+        last ones and max_fps allows
+        """
+        if not self.viewers or self.pending:
+            return
+        now = monotonic()
+        if now < self.next_frame:
+            return
+        self.next_frame = now + self.interval
+        with self.lock:
+            for view, image in (("frame", frame),
+                                ("difference", difference_image),
+                                ("threshold", threshold_image)):
+                if image is None or not self.clients[view]:
+                    continue
+                buf = self.buffers.get(view)
+                if buf is None or buf.shape != image.shape:
+                    buf = self.buffers[view] = np.empty_like(image)
+                np.copyto(buf, image)
+                self.pending.add(view)
+            if self.pending:
+                self.new_frame.notify()
+
+    def update(self):
+        """ encode pending views until the streamer is stopped """
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        while True:
+            with self.lock:
+                while not self.pending and not self.stopped:
+                    self.new_frame.wait()
+                if self.stopped:
+                    return
+                views = list(self.pending)
+            # publish() leaves the buffers alone until pending is cleared
+            for view in views:
+                encoded, jpeg = cv2.imencode(".jpg", self.buffers[view], params)
+                if encoded:
+                    self.jpegs[view] = jpeg.tobytes()
+            with self.new_jpeg:
+                self.jpeg_seq += 1
+                self.new_jpeg.notify_all()
+            with self.lock:
+                self.pending.clear()
+
+    def add_client(self, view, count):
+        """ count a viewer of view arriving (1) or leaving (-1) """
+        with self.lock:
+            self.clients[view] += count
+            self.viewers += count
+        logging.info("MJPEG %s viewers %i", view, self.clients[view])
+
+    def stream(self, view, wfile):
+        """ write each new JPEG of view to wfile until the client leaves """
+        self.add_client(view, 1)
+        seq = None
+        try:
+            while not self.stopped:
+                with self.new_jpeg:
+                    if seq == self.jpeg_seq:
+                        self.new_jpeg.wait(5.0)
+                    if seq == self.jpeg_seq:
+                        continue
+                    seq = self.jpeg_seq
+                jpeg = self.jpegs[view]
+                if jpeg is None:
+                    continue
+                wfile.write(("--%s\r\nContent-Type: image/jpeg\r\n"
+                             "Content-Length: %i\r\n\r\n"
+                             % (BOUNDARY, len(jpeg))).encode("ascii"))
+                wfile.write(jpeg)
+                wfile.write(b"\r\n")
+                wfile.flush()
+        except (IOError, OSError):
+            pass  # the viewer went away
+        finally:
+            self.add_client(view, -1)
+
+    def stop(self):
+        """ stop serving and encoding """
+        with self.lock:
+            self.stopped = True
+            self.new_frame.notify()
+        self.server.shutdown()
+
+
+def make_streamer(port, host="127.0.0.1", max_fps=5, quality=70):
+    """ return a started MjpegStreamer, or a NullStreamer if port is 0 """
+    if not port:
+        return NullStreamer()
+    streamer = MjpegStreamer(port, host, max_fps, quality).start()
+    logging.info("MJPEG stream at http://%s:%i/", host, port)
+    return streamer
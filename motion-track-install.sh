@@ -30,10 +30,28 @@ if [ $? -ne 0 ] ;  then
   wget -O motion-track-install.sh https://raw.github.com/pageauc/motion-track/master/motion-track-install.sh
   wget -O motion-track.py https://raw.github.com/pageauc/motion-track/master/motion-track.py
   wget -O config.py https://raw.github.com/pageauc/motion-track/master/config.py
+  wget -O motion_detector.py https://raw.github.com/pageauc/motion-track/master/motion_detector.py
+  wget -O benchmark.py https://raw.github.com/pageauc/motion-track/master/benchmark.py
+  wget -O log_queue.py https://raw.github.com/pageauc/motion-track/master/log_queue.py
+  wget -O motion_events.py https://raw.github.com/pageauc/motion-track/master/motion_events.py
+  wget -O display_worker.py https://raw.github.com/pageauc/motion-track/master/display_worker.py
+  wget -O mjpeg_stream.py https://raw.github.com/pageauc/motion-track/master/mjpeg_stream.py
+  wget -O object_tracker.py https://raw.github.com/pageauc/motion-track/master/object_tracker.py
+  wget -O latency_trace.py https://raw.github.com/pageauc/motion-track/master/latency_trace.py
+  wget -O stage_timer.py https://raw.github.com/pageauc/motion-track/master/stage_timer.py
   wget -O Readme.md https://raw.github.com/pageauc/motion-track/master/Readme.md
 else
   wget -O motion-track.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/motion-track.py
   wget -O config.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/config.py
+  wget -O motion_detector.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/motion_detector.py
+  wget -O benchmark.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/benchmark.py
+  wget -O log_queue.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/log_queue.py
+  wget -O motion_events.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/motion_events.py
+  wget -O display_worker.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/display_worker.py
+  wget -O mjpeg_stream.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/mjpeg_stream.py
+  wget -O object_tracker.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/object_tracker.py
+  wget -O latency_trace.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/latency_trace.py
+  wget -O stage_timer.py -q --show-progress https://raw.github.com/pageauc/motion-track/master/stage_timer.py
   wget -O Readme.md -q --show-progress  https://raw.github.com/pageauc/motion-track/master/Readme.md
 fi
 echo "Done Download"
@@ -41,6 +59,7 @@ echo "------------------------------------------------"
 echo ""
 echo "2 - Make required Files Executable"
 chmod +x motion-track.py
+chmod +x benchmark.py
 chmod +x motion-track-install.sh
 echo "Done Permissions"
 echo "------------------------------------------------"
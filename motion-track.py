@@ -47,20 +47,25 @@ logging.basicConfig(level=logging.DEBUG,
                     format='%(asctime)s %(levelname)-8s %(funcName)-10s %(message)s',
                     datefmt='%Y-%m-%d %H:%M:%S')
 import time
+try:
+    from time import monotonic  # Capture timestamps immune to clock changes
+except ImportError:
+    monotonic = time.time       # python2 has no monotonic clock
+STARTUP_TIME = monotonic()
 import os
 import subprocess
 import sys
-from threading import Thread
-import numpy as np
-
+import signal
+import multiprocessing
+import bisect
+import atexit
+from threading import Thread, Condition, Lock
 try:
-    import cv2
+    import queue
 except ImportError:
-    logging.error("Could Not import cv2 library "
-                  "Install or compile opencv")
-    logging.error("If using python3 then"
-                  "See https://github.com/pageauc/opencv3-setup")
-    sys.exit(1)
+    import Queue as queue  # python2
+import numpy as np
+
 PROG_VER = "version 1.85"
 # Find the full path of this python script
 SCRIPT_PATH = os.path.abspath(__file__)
@@ -95,10 +100,33 @@ if not os.path.exists(CONFIG_FILE_PATH):
     CONFIG_FILE.write(WGET_FILE.read())
     CONFIG_FILE.close()
 from config import *  # Read variables from config.py file
+if not WEBCAM and not FILE_SOURCE:
+    # Check for the pi camera module while the slow cv2 import runs
+    CAM_CHECK = subprocess.Popen("vcgencmd get_camera", shell=True,
+                                 stdout=subprocess.PIPE)
+try:
+    import cv2
+except ImportError:
+    logging.error("Could Not import cv2 library "
+                  "Install or compile opencv")
+    logging.error("If using python3 then"
+                  "See https://github.com/pageauc/opencv3-setup")
+    sys.exit(1)
+from motion_detector import MotionDetector
+from object_tracker import ObjectTracker
+from stage_timer import make_timer, StartupTimer
+from latency_trace import make_tracer
+from mjpeg_stream import make_streamer
+from display_worker import make_display
+from motion_events import make_event_stream
+from log_queue import start_logging, FrameSummary
 print 'WINDOW IS {}'.format(window_on)
 # Check that pi camera module is installed and enabled
-if not WEBCAM:
-    CAM_RESULT = subprocess.check_output("vcgencmd get_camera", shell=True)
+if not WEBCAM and not FILE_SOURCE:
+    CAM_RESULT = CAM_CHECK.communicate()[0]
+    if CAM_CHECK.returncode:
+        raise subprocess.CalledProcessError(CAM_CHECK.returncode,
+                                            "vcgencmd get_camera")
     CAM_RESULT = CAM_RESULT.decode("utf-8")
     CAM_RESULT = CAM_RESULT.replace("\n", "")
     if (CAM_RESULT.find("0")) >= 0:   # Was a 0 found in vcgencmd output
@@ -143,83 +171,310 @@ MO_COLOR = CV_GREEN  # color of motion circle or rectangle
 import pigpio
 DIR = 17     # Direction GPIO Pin
 STEP = 27    # Step GPIO Pin
-# Connect to pigpiod daemon
-pi = pigpio.pi()
+pi = None    # pigpiod connection made by connect_motor()
+
+#------------------------------------------------------------------------------
+class WaveCache:
+    """
+    Keep one pigpio wave per step frequency so a move only has to send a
+    new chain instead of creating and deleting a wave per ramp level.
+    """
+    def __init__(self, frequencies=()):
+        self.wids = {}
+        for frequency in frequencies:
+            self.wave_id(frequency)
 
-# Set up pins as an output
-pi.set_mode(DIR, pigpio.OUTPUT)
-pi.set_mode(STEP, pigpio.OUTPUT)
+    def wave_id(self, frequency):
+        """ return the wave id for frequency, creating it on first use """
+        wid = self.wids.get(frequency)
+        if wid is None:
+            micros = int(500000 / frequency)
+            wf = []
+            wf.append(pigpio.pulse(1 << STEP, 0, micros))  # pulse on
+            wf.append(pigpio.pulse(0, 1 << STEP, micros))  # pulse off
+            pi.wave_add_generic(wf)
+            wid = pi.wave_create()
+            self.wids[frequency] = wid
+        return wid
 
-RAMP_UP = (
-    (250, 30),
-    (320, 40),
-    (400, 45),
-    (500, 60),
-    (800, 90),
-    (1000, 200),
-    #(1600, 160),
-    #(2000, 200),
-)
+    def rebuild(self):
+        """ recreate every cached wave eg. after pigpiod lost its waves """
+        frequencies = list(self.wids)
+        self.wids = {}
+        pi.wave_clear()
+        for frequency in frequencies:
+            self.wave_id(frequency)
+
+
+class MotionPlanner:
+    """
+    Acceleration limited stepper move profiles.  The climb from min_freq
+    to max_freq at accel steps/s/s is worked out once as levels of
+    (frequency, steps), each lasting the same time.  A move climbs as many
+    levels as fit in half its steps, runs the rest one level higher and
+    comes back down the same levels, so every step count gets the fastest
+    profile the limits allow.  "trapezoid" accelerates at a constant rate,
+    "scurve" eases in and out of the acceleration to avoid jerk.
+    """
+    def __init__(self, min_freq=STEPPER_MIN_FREQ, max_freq=STEPPER_MAX_FREQ,
+                 accel=STEPPER_ACCEL, levels=STEPPER_RAMP_LEVELS,
+                 profile=STEPPER_PROFILE):
+        climb_time = (max_freq - min_freq) / float(accel)
+        if profile == "scurve":
+            climb_time *= 1.5  # smoothstep peaks at 1.5 times its mean slope
+        level_time = climb_time / levels
+        self.max_freq = max_freq
+        self.levels = []         # (frequency, steps) from min_freq up
+        self.climbed = [0]       # steps taken to finish each level
+        for i in range(levels):
+            x = float(i) / levels
+            if profile == "scurve":
+                x = x * x * (3 - 2 * x)
+            frequency = int(round(min_freq + (max_freq - min_freq) * x))
+            steps = max(1, int(round(frequency * level_time)))
+            self.levels.append((frequency, steps))
+            self.climbed.append(self.climbed[-1] + steps)
+
+    def frequencies(self):
+        """ every frequency a planned move can use """
+        return [frequency for frequency, steps in self.levels] + [self.max_freq]
+
+    def plan(self, total_steps):
+        """
+        Return the list of integer (frequency, steps) levels for a move of
+        total_steps, accelerating, cruising and decelerating
+        """
+        total_steps = int(total_steps)
+        count = bisect.bisect_right(self.climbed, total_steps // 2) - 1
+        up = self.levels[:count]
+        cruise = total_steps - 2 * self.climbed[count]
+        ramp = list(up)
+        if cruise:
+            if count < len(self.levels):
+                ramp.append((self.levels[count][0], cruise))
+            else:
+                ramp.append((self.max_freq, cruise))
+        ramp.extend(reversed(up))
+        return ramp
+
+
+def build_chain(ramp):
+    """Build a pigpio wave chain for ramp from the cached waves"""
+    chain = []
+    for frequency, steps in ramp:
+        wid = wave_cache.wave_id(frequency)
+        while steps > 0:
+            count = min(steps, 65535)  # most repeats a chain loop allows
+            chain += [255, 0, wid, 255, 1, count & 255, count >> 8]
+            steps -= count
+    return chain
 
 
 def generate_ramp(ramp):
-    """Generate ramp wave forms.
+    """Start transmitting ramp wave forms.
     ramp:  List of [Frequency, Steps]
+    The chain runs in the background, poll pi.wave_tx_busy() to see
+    when it has finished.
     """
-    #pi.wave_clear()     # clear existing waves
-    length = len(ramp)  # number of ramp levels
-    wid = [-1] * length
-
-    # Generate a wave per ramp level
-    for i in range(length):
-        frequency = ramp[i][0]
-        micros = int(500000 / frequency)
-        wf = []
-        wf.append(pigpio.pulse(1 << STEP, 0, micros))  # pulse on
-        wf.append(pigpio.pulse(0, 1 << STEP, micros))  # pulse off
-        pi.wave_add_generic(wf)
-        wid[i] = pi.wave_create()
-
-    # Generate a chain of waves
-    chain = []
-    for i in range(length):
-        steps = ramp[i][1]
-        x = steps & 255
-        y = steps >> 8
-        chain += [255, 0, wid[i], 255, 1, x, y]
+    try:
+        pi.wave_chain(build_chain(ramp))  # Transmit chain
+    except pigpio.error as err:
+        # pigpiod was restarted or its waves were cleared
+        logging.warning("Rebuilding wave cache after pigpio error: %s", err)
+        wave_cache.rebuild()
+        pi.wave_chain(build_chain(ramp))
 
-    pi.wave_chain(chain)  # Transmit chain
-    while pi.wave_tx_busy():
-        time.sleep(0.2)
-    for id_ in wid:
-        pi.wave_delete(id_)
-    time.sleep(0.25)
+# Plan the acceleration once, connect_motor() builds its waves and
+# moves only send a chain of these
+planner = MotionPlanner()
+wave_cache = None
+
+
+def connect_motor():
+    """ connect to the pigpiod daemon, set up the pins and build the waves """
+    global pi, wave_cache
+    pi = pigpio.pi()
+    # Set up pins as an output
+    pi.set_mode(DIR, pigpio.OUTPUT)
+    pi.set_mode(STEP, pigpio.OUTPUT)
+    wave_cache = WaveCache(planner.frequencies())
+
+
+def ramp_steps_done(ramp, elapsed):
+    """Estimate how many steps of ramp were sent after elapsed seconds"""
+    done = 0
+    for frequency, steps in ramp:
+        duration = float(steps) / frequency
+        if elapsed < duration:
+            return done + int(elapsed * frequency)
+        elapsed -= duration
+        done += steps
+    return done
 
 
 def move_stepper(total_steps, direction):
+    """Start a move of total_steps in direction and return its ramp"""
     pi.write(DIR, direction)
     time.sleep(0.1)
-    ramp = []
-    steps_left = total_steps / 2
-    # Build acceleration
-    for frequency, steps in RAMP_UP:
-        if steps > steps_left:
-            ramp.append((frequency, steps_left))
-            steps_left = 0
-            break
-        else:
-            ramp.append((frequency, steps))
-            steps_left -= steps
-    if steps_left:
-        # Continue for the rest of the total steps at max speed
-        ramp.append((RAMP_UP[-1][0], steps_left))
+    ramp = planner.plan(total_steps)
+    generate_ramp(ramp)
+    return ramp
+
+#------------------------------------------------------------------------------
+class StepperController:
+    """
+    Drive the stepper from its own thread so track() never waits on a move.
+    Targets are absolute step positions.  Only the latest queued target is
+    kept and a new target stops a move that is still running and retargets
+    from wherever the platform got to.
+    """
+    def __init__(self, poll_interval=STEPPER_POLL_SEC,
+                 settle_time=STEPPER_SETTLE_SEC):
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.targets = queue.Queue()
+        self.lock = Lock()
+        self.position = 0       # absolute steps at the start of the move
+        self.target = 0         # absolute steps last requested
+        self.move_dir = 0       # +1, -1 or 0 when idle
+        self.move_ramp = None   # ramp of the move in progress
+        self.move_start = None  # monotonic time the move started
+        self.failures = 0       # moves abandoned after a pigpio error
+        self.stopped = False
+
+    def start(self):
+        """ start the thread that executes stepper moves """
+        t = Thread(target=self.update, args=())
+        t.daemon = True
+        t.start()
+        return self
+
+    def move_to(self, target, trace=None):
+        """
+        queue an absolute step target, superseding any older target.
+        trace is the (frame_seq, capture_time, detect_time) of the frame
+        that asked for the move
+        """
+        self.target = int(target)
+        self.targets.put((self.target, trace))
 
-    # build deceleration
-    full_ramp = list(ramp)
-    while ramp:
-        full_ramp.append(ramp.pop())
+    def get_position(self):
+        """ return the current absolute step position of the platform """
+        return self.position_at(monotonic())
 
-    generate_ramp(full_ramp)
+    def position_at(self, when):
+        """
+        return the absolute step position of the platform at monotonic
+        time when during the current move, eg. when a frame was captured
+        """
+        with self.lock:
+            if self.move_ramp is None or when <= self.move_start:
+                return self.position
+            elapsed = when - self.move_start
+            return (self.position +
+                    self.move_dir * ramp_steps_done(self.move_ramp, elapsed))
+
+    def is_moving(self):
+        """ return True while a move is being transmitted """
+        return self.move_ramp is not None
+
+    def latest_target(self, timeout):
+        """
+        wait for a target and return only the most recent (target, trace)
+        queued or None if there is none
+        """
+        try:
+            target = self.targets.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        while True:
+            try:
+                newer = self.targets.get_nowait()
+            except queue.Empty:
+                return target
+            latency_tracer.superseded()
+            target = newer
+
+    def update(self):
+        """ keep executing the latest target until the thread is stopped """
+        pending = None
+        while not self.stopped:
+            if pending is None:
+                pending = self.latest_target(self.poll_interval)
+                if pending is None:
+                    continue
+            target, trace = pending
+            steps = target - self.position
+            pending = None
+            if steps:
+                try:
+                    pending = self.run_move(steps, trace)
+                except Exception as err:
+                    self.move_failed(err)
+
+    def move_failed(self, err):
+        """
+        Abandon a move that raised eg. pigpiod was restarted or its socket
+        dropped, reconnecting if need be, so later targets still move
+        """
+        self.failures += 1
+        logging.error("Stepper Move Failed %s", err)
+        position = self.get_position()
+        with self.lock:
+            self.position = position
+            self.move_dir = 0
+            self.move_ramp = None
+            self.move_start = None
+        if not self.stopped and not pi.connected:
+            logging.warning("Reconnecting to pigpiod ...")
+            try:
+                connect_motor()
+            except Exception as err:
+                logging.error("Could Not Reconnect to pigpiod %s", err)
+        time.sleep(self.settle_time)  # do not spin on a failing daemon
+
+    def run_move(self, steps, trace=None):
+        """
+        Transmit a move of steps and wait for it to finish.  Returns a new
+        (target, trace) if one arrived during the move, otherwise None.
+        """
+        direction = int(steps > 0)
+        command_start = monotonic()
+        ramp = move_stepper(abs(steps), direction)
+        with self.lock:
+            self.move_dir = 1 if steps > 0 else -1
+            self.move_ramp = ramp
+            self.move_start = monotonic()
+        stage_timer.record("stepper_start", self.move_start - command_start)
+        if trace:
+            latency_tracer.motor_started(trace, command_start, self.move_start)
+        newer = None
+        while pi.wave_tx_busy() and not self.stopped:
+            newer = self.latest_target(self.poll_interval)
+            if newer is not None:
+                pi.wave_tx_stop()  # abandon this move and retarget
+                break
+        position = self.get_position()
+        stage_timer.record("stepper_move", monotonic() - self.move_start)
+        with self.lock:
+            if newer is None and not self.stopped:
+                position = self.position + steps  # move ran to completion
+            self.position = position
+            self.move_dir = 0
+            self.move_ramp = None
+            self.move_start = None
+        if newer is None:
+            time.sleep(self.settle_time)
+            newer = self.latest_target(0)
+        return newer
+
+    def stop(self):
+        """ stop any move in progress and end the thread """
+        self.stopped = True
+        try:
+            pi.wave_tx_stop()
+        except Exception as err:
+            logging.warning("Could Not Stop Stepper %s", err)
 
 
 CURRENT_X = CAMERA_WIDTH / 2
@@ -236,7 +491,12 @@ min_threshold_percent = 0.05
 max_threshold_percent = 0.75
 
 
-def motion_detected(xy_pos, force=False):
+def motion_detected(xy_pos, force=False, trace=None):
+    """
+    Pan toward xy_pos if it is far enough from CURRENT_X.  trace is passed
+    on to the stepper controller for latency tracing.
+    Returns True if a move was requested
+    """
     global CURRENT_X
     x_pos, y_pos = xy_pos
     min_threshold = min_threshold_percent * CAMERA_WIDTH
@@ -250,139 +510,892 @@ def motion_detected(xy_pos, force=False):
         not force
 
     ):
-        return
+        return False
 
-    direction = int(x_pos > CURRENT_X)
-    total_steps = difference * STEPS_PER_PIXEL
-
-    move_stepper(total_steps, direction)
+    # CURRENT_X starts at the centre with the platform at step 0 so the
+    # absolute step target is the pixel offset from the centre.
+    stepper.move_to((x_pos - CAMERA_WIDTH / 2) * STEPS_PER_PIXEL, trace)
     CURRENT_X = x_pos
+    return True
 
 
 #------------------------------------------------------------------------------
-class PiVideoStream:
+class SequencedStream(object):
+    """
+    Common frame handoff for the threaded video streams.  Every frame is
+    tagged with a monotonic sequence number and capture time so track()
+    can block for a new frame instead of processing the same one again.
+    """
+    live = True   # False if frames wait for the reader, set by the class
+
+    def __init__(self):
+        self.frame = None
+        self.frame_seq = 0       # sequence number of self.frame
+        self.frame_time = None   # monotonic capture time of self.frame
+        self.read_seq = 0        # last sequence returned by read_next
+        self.frames_dropped = 0  # frames never returned by read_next
+        self.frame_ready = Condition()
+        self.luma = False        # True if frames are single channel luma
+        self.eof = False         # True once a file source has no more frames
+        self.dark = False        # True while frames are black eg. lens cap on
+        self.dark_since = None   # monotonic time the current dark spell began
+        self.frame_level = 0.0   # mean brightness of the last sampled grid
+        self.sample = None       # copy of the last sampled grid
+        self.frozen_frames = 0   # frames in a row identical to the last one
+        self.invalid_frames = 0  # failed reads in a row
+        self.epoch = 0           # bumped each time the device is reopened
+        self.frame_epoch = 0     # epoch self.frame came from
+        self.read_epoch = 0      # epoch of the last read_next frame
+        self.settled = 0         # steady frames in a row, see settle()
+        self.settle_level = None  # frame_level of the last settle() frame
+        self.settle_epoch = 0    # epoch settling() last started on
+        self.settle_deadline = None  # when settling() gives up, None if done
+        self.opened = monotonic()  # when the device was last opened
+
+    def to_bgr(self, frame):
+        """ return a BGR version of frame for display """
+        return frame
+
+    def check_dark(self, frame, frame_time):
+        """
+        Sample every BLACK_FRAME_STEP pixel of frame and flag it as dark if
+        the mean brightness is below BLACK_FRAME_LEVEL.  Using the mean keeps
+        the test independent of resolution and channel count.  A sample
+        exactly the same as the last one counts a frozen frame, real
+        sensors always have some noise.
+        """
+        sample = frame[::BLACK_FRAME_STEP, ::BLACK_FRAME_STEP]
+        self.frame_level = float(sample.mean())
+        if self.sample is None or self.sample.shape != sample.shape:
+            self.sample = sample.copy()
+            self.frozen_frames = 0
+        elif np.array_equal(sample, self.sample):
+            self.frozen_frames += 1
+        else:
+            np.copyto(self.sample, sample)
+            self.frozen_frames = 0
+        if self.frame_level < BLACK_FRAME_LEVEL:
+            if not self.dark:
+                self.dark_since = frame_time
+                self.dark = True
+        else:
+            self.dark = False
+            self.dark_since = None
+
+    def dark_duration(self):
+        """ return seconds the frames have been continuously dark """
+        dark_since = self.dark_since
+        if dark_since is None:
+            return 0.0
+        return monotonic() - dark_since
+
+    def publish(self, frame, epoch=None):
+        """
+        store a newly captured frame and wake any waiting reader.  Frames
+        from a capture thread of an older epoch are ignored
+        """
+        if epoch is not None and epoch != self.epoch:
+            return
+        if frame is None or not frame.size:
+            self.invalid_frames += 1
+            return
+        self.invalid_frames = 0
+        frame_time = monotonic()
+        self.check_dark(frame, frame_time)
+        with self.frame_ready:
+            self.frame = frame
+            self.frame_seq += 1
+            self.frame_time = frame_time
+            self.frame_epoch = self.epoch
+            self.frame_ready.notify_all()
+
+    def last_frame_age(self):
+        """ seconds since the last frame, or since the device was opened """
+        return monotonic() - max(self.frame_time or 0.0, self.opened)
+
+    def open_device(self):
+        """ open the camera, overridden by the camera streams """
+        pass
+
+    def close_device(self):
+        """ close the camera, overridden by the camera streams """
+        pass
+
+    def reconnect(self):
+        """
+        Close the camera and open it again with a new capture thread.  The
+        old capture thread may be stuck in a read, anything it publishes
+        later is ignored.  Returns False if the camera could not be opened,
+        always for a file source which has no device to reopen.
+        """
+        if not self.live:
+            return False
+        with self.frame_ready:
+            self.epoch += 1
+        try:
+            self.close_device()
+        except Exception as err:
+            logging.warning("Could Not Close Camera %s", err)
+        self.opened = monotonic()
+        try:
+            self.open_device()
+        except Exception as err:
+            logging.warning("Could Not Open Camera %s", err)
+            return False
+        self.sample = None
+        self.frozen_frames = 0
+        self.invalid_frames = 0
+        self.start()
+        return True
+
+    def read(self):
+        """ return the frame most recently read """
+        return self.frame
+
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        """
+        Wait for the camera to warm up instead of sleeping a fixed time.
+        Ready is READY_SETTLE_FRAMES frames in a row that are not dark and
+        whose mean brightness moved less than READY_LEVEL_CHANGE, ie. the
+        exposure has settled.  Returns False after timeout seconds eg. the
+        lens cap is on, track() then handles the dark frames as usual.
+        """
+        if not self.live:
+            return True  # never consume the frames of a file source
+        deadline = monotonic() + timeout
+        self.settled = 0
+        self.settle_level = None
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            frame = self.read_next(remaining)[0]
+            if frame is not None and self.settle():
+                break
+        self.frames_dropped = 0  # warm up frames are not dropped frames
+        return True
+
+    def settle(self):
+        """
+        Count the frame just read toward READY_SETTLE_FRAMES steady frames
+        and return True once there are enough
+        """
+        level = self.frame_level
+        if (self.dark or self.settle_level is None or
+                abs(level - self.settle_level) > READY_LEVEL_CHANGE):
+            self.settled = 0
+        else:
+            self.settled += 1
+        self.settle_level = level
+        return self.settled >= READY_SETTLE_FRAMES
+
+    def settling(self):
+        """
+        Call once for each frame read.  Returns True while the exposure of
+        a reopened device is still settling, by the same test as
+        wait_ready() and for at most READY_TIMEOUT seconds, so its frames
+        should not be used for detection yet
+        """
+        if self.read_epoch != self.settle_epoch:
+            self.settle_epoch = self.read_epoch
+            self.settle_deadline = monotonic() + READY_TIMEOUT
+            self.settled = 0
+            self.settle_level = None
+        if self.settle_deadline is None:
+            return False
+        if self.settle() or monotonic() >= self.settle_deadline:
+            self.settle_deadline = None
+            return False
+        return True
+
+    def read_next(self, timeout=None):
+        """
+        Wait up to timeout seconds for a frame newer than the last one
+        returned and return (frame, seq, frame_time).  frame is None if
+        no new frame arrived in time.
+        """
+        with self.frame_ready:
+            if self.frame_seq == self.read_seq:
+                self.frame_ready.wait(timeout)
+            if self.frame_seq == self.read_seq:
+                return None, self.read_seq, None
+            if self.read_seq:
+                self.frames_dropped += self.frame_seq - self.read_seq - 1
+            self.read_seq = self.frame_seq
+            self.read_epoch = self.frame_epoch
+            self.hold(self.frame)
+            return self.frame, self.frame_seq, self.frame_time
+
+    def hold(self, frame):
+        """
+        the reader now has frame and is done with the one it had before,
+        for streams that reuse frame buffers
+        """
+        pass
+
+#------------------------------------------------------------------------------
+class LumaCapture:
+    """
+    capture_continuous output for format="yuv" that writes each frame into
+    a small ring of preallocated buffers.  Readers get a view of the Y
+    (luma) plane and only pay for a colour conversion if they need BGR.
+    The frame a reader holds, see hold(), and the last published frame
+    are never written over however far behind the reader falls, so at
+    least 4 buffers are used.
+    """
+    def __init__(self, resolution, buffers=LUMA_BUFFERS):
+        buffers = max(buffers, 4)
+        self.width, self.height = resolution
+        # picamera pads yuv frames to a multiple of 32 wide and 16 high
+        self.fwidth = (self.width + 31) // 32 * 32
+        self.fheight = (self.height + 15) // 16 * 16
+        y_size = self.fwidth * self.fheight
+        self.buffers = [np.empty(y_size * 3 // 2, dtype=np.uint8)
+                        for i in range(buffers)]
+        # Views are made once so a luma frame can be matched to its buffer
+        self.lumas = [buf[:y_size].reshape(self.fheight, self.fwidth)
+                      [:self.height, :self.width] for buf in self.buffers]
+        self.index = 0
+        self.offset = 0
+        self.held = None        # index of the buffer a reader holds
+        self.published = None   # index of the last completed buffer
+
+    def write(self, data):
+        """ copy camera data into the current ring buffer """
+        data = np.frombuffer(data, dtype=np.uint8)
+        buf = self.buffers[self.index]
+        end = min(self.offset + data.size, buf.size)
+        buf[self.offset:end] = data[:end - self.offset]
+        self.offset = end
+        return data.size
+
+    def flush(self):
+        """ nothing buffered outside the ring """
+        pass
+
+    def next_frame(self):
+        """
+        Return the luma plane of the completed frame and move on to the
+        next buffer that is not this frame, the previous frame which a
+        reader may be about to take, or the frame a reader holds
+        """
+        completed = self.index
+        busy = (completed, self.published, self.held)
+        self.published = completed
+        index = (completed + 1) % len(self.buffers)
+        while index in busy:
+            index = (index + 1) % len(self.buffers)
+        self.index = index
+        self.offset = 0
+        return self.lumas[completed]
+
+    def hold(self, luma):
+        """ keep luma from being written over until the next hold() """
+        for index, view in enumerate(self.lumas):
+            if view is luma:
+                self.held = index
+                return
+
+    def to_bgr(self, luma):
+        """ convert the yuv buffer behind a luma frame to BGR """
+        for buf, view in zip(self.buffers, self.lumas):
+            if view is luma:
+                yuv = buf.reshape(self.fheight * 3 // 2, self.fwidth)
+                bgr = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
+                return np.ascontiguousarray(bgr[:self.height, :self.width])
+        return cv2.cvtColor(luma, cv2.COLOR_GRAY2BGR)
+
+#------------------------------------------------------------------------------
+class PiVideoStream(SequencedStream):
     """
     Pi Camera initialize then stream and read the first video frame from stream
     """
     def __init__(self, resolution=(CAMERA_WIDTH, CAMERA_HEIGHT),
                  framerate=CAMERA_FRAMERATE, rotation=0,
-                 hflip=False, vflip=False):
+                 hflip=False, vflip=False, luma=CAMERA_LUMA):
+        SequencedStream.__init__(self)
+        self.resolution = resolution
+        self.framerate = framerate
+        self.rotation = rotation
+        self.hflip = hflip
+        self.vflip = vflip
+        self.luma = luma
         try:
-            self.camera = PiCamera()
+            self.open_device()
         except:
             logging.error("PiCamera Already in Use by Another Process")
             logging.error("Exiting %s Due to Error", PROG_NAME)
             sys.exit(1)
-        self.camera.resolution = resolution
-        self.camera.framerate = framerate
-        self.camera.rotation = rotation
-        self.camera.hflip = hflip
-        self.camera.vflip = vflip
-        self.rawCapture = PiRGBArray(self.camera, size=resolution)
-        self.stream = self.camera.capture_continuous(self.rawCapture,
-                                                     format="bgr",
-                                                     use_video_port=True)
-        # initialize the frame and the variable used to indicate
+        # initialize the variable used to indicate
         # if the thread should be stopped
-        self.frame = None
         self.stopped = False
 
+    def open_device(self):
+        """ open the camera and its continuous capture """
+        self.camera = PiCamera()
+        self.camera.resolution = self.resolution
+        self.camera.framerate = self.framerate
+        self.camera.rotation = self.rotation
+        self.camera.hflip = self.hflip
+        self.camera.vflip = self.vflip
+        if self.luma:
+            # Detection only needs the Y plane so skip BGR conversion
+            self.rawCapture = LumaCapture(self.resolution)
+            capture_format = "yuv"
+        else:
+            self.rawCapture = PiRGBArray(self.camera, size=self.resolution)
+            capture_format = "bgr"
+        self.stream = self.camera.capture_continuous(self.rawCapture,
+                                                     format=capture_format,
+                                                     use_video_port=True)
+
+    def close_device(self):
+        """ release the camera resources """
+        self.stream.close()
+        if not self.luma:
+            self.rawCapture.close()
+        self.camera.close()
+
     def start(self):
         """ start the thread to read frames from the video stream """
-        t = Thread(target=self.update, args=())
+        t = Thread(target=self.update, args=(self.stream, self.rawCapture,
+                                             self.epoch))
         t.daemon = True
         t.start()
         return self
 
-    def update(self):
-        """ keep looping infinitely until the thread is stopped """
-        for f in self.stream:
-            # grab the frame from the stream and clear the stream in
-            # preparation for the next frame
-            self.frame = f.array
-            self.rawCapture.truncate(0)
-            # if the thread indicator variable is set, stop the thread
-            # and release camera resources
-            if self.stopped:
-                self.stream.close()
-                self.rawCapture.close()
-                self.camera.close()
-                return
+    def update(self, stream, raw_capture, epoch):
+        """ keep looping until the thread is stopped or the camera reopened """
+        try:
+            for f in stream:
+                # grab the frame from the stream and clear the stream in
+                # preparation for the next frame
+                if self.luma:
+                    self.publish(f.next_frame(), epoch)
+                else:
+                    self.publish(f.array, epoch)
+                    raw_capture.truncate(0)
+                if epoch != self.epoch:
+                    return  # reconnect() closed this camera
+                # if the thread indicator variable is set, stop the thread
+                # and release camera resources
+                if self.stopped:
+                    self.close_device()
+                    return
+        except Exception as err:
+            if epoch == self.epoch and not self.stopped:
+                logging.warning("Pi Camera Capture Failed %s", err)
 
-    def read(self):
-        """ return the frame most recently read """
-        return self.frame
+    def to_bgr(self, frame):
+        """ return a BGR version of frame for display """
+        if self.luma:
+            return self.rawCapture.to_bgr(frame)
+        return frame
+
+    def hold(self, frame):
+        """ keep the luma ring from writing over the frame being read """
+        if self.luma:
+            self.rawCapture.hold(frame)
 
     def stop(self):
         """ indicate that the thread should be stopped """
         self.stopped = True
 
 #------------------------------------------------------------------------------
-class WebcamVideoStream:
+class WebcamVideoStream(SequencedStream):
     """
     WebCam initialize then stream and read the first video frame from stream
     """
     def __init__(self, cam_src=WEBCAM_SRC, cam_width=WEBCAM_WIDTH,
                  cam_height=WEBCAM_HEIGHT):
-        self.webcam = cv2.VideoCapture(cam_src)
-        self.webcam.set(3, cam_width)
-        self.webcam.set(4, cam_height)
-        (self.grabbed, self.frame) = self.webcam.read()
+        SequencedStream.__init__(self)
+        self.cam_src = cam_src
+        self.cam_width = cam_width
+        self.cam_height = cam_height
+        try:
+            self.open_device()
+        except IOError as err:
+            logging.error("%s, the watchdog will keep trying", err)
+        (self.grabbed, frame) = self.webcam.read()
+        if self.grabbed:
+            self.publish(frame)
         # initialize the variable used to indicate if the thread should
         # be stopped
         self.stopped = False
 
+    def open_device(self):
+        """ open the webcam at the requested size """
+        self.webcam = cv2.VideoCapture(self.cam_src)
+        if not self.webcam.isOpened():
+            raise IOError("Could Not Open Web Camera %s" % self.cam_src)
+        self.webcam.set(3, self.cam_width)
+        self.webcam.set(4, self.cam_height)
+
+    def close_device(self):
+        """
+        leave the webcam to the old capture thread, it releases it once a
+        stalled read returns so the two threads never touch it at once
+        """
+        pass
+
     def start(self):
         """ start the thread to read frames from the video stream """
+        t = Thread(target=self.update, args=(self.webcam, self.epoch))
+        t.daemon = True
+        t.start()
+        return self
+
+    def update(self, webcam, epoch):
+        """ keep looping until the thread is stopped or the webcam reopened """
+        while not self.stopped and epoch == self.epoch:
+            # read the next frame from the webcam stream
+            (grabbed, frame) = webcam.read()
+            if grabbed:
+                self.publish(frame, epoch)
+            else:
+                self.publish(None, epoch)  # count the failed read
+                time.sleep(0.01)  # a failing webcam returns at once
+        # release here rather than in reconnect() as a stalled read may
+        # still be using the webcam, reconnect() retries until it is free
+        webcam.release()
+
+    def stop(self):
+        """ indicate that the thread should be stopped """
+        self.stopped = True
+
+#------------------------------------------------------------------------------
+class FileVideoStream(SequencedStream):
+    """
+    Read frames from a video file, an image file or a directory of them on
+    a background thread into a bounded prefetch queue.  Unlike the camera
+    streams no frame is ever dropped, the reader waits when the queue is
+    full and read_next() returns every frame in order.  Frames are paced
+    to the file frame rate unless max_speed is True.
+    """
+    live = False
+    IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, path=FILE_SOURCE, resolution=(IMAGE_W, IMAGE_H),
+                 prefetch=FILE_PREFETCH, max_speed=FILE_MAX_SPEED):
+        SequencedStream.__init__(self)
+        self.resolution = resolution
+        self.max_speed = max_speed
+        self.clips = self.find_clips(path)  # list of [path, frames, fps]
+        self.total_frames = sum(clip[1] for clip in self.clips)
+        self.fps = self.clips[0][2] if self.clips else CAMERA_FRAMERATE
+        if self.fps <= 0:
+            self.fps = CAMERA_FRAMERATE
+        logging.info("%s has %i frames in %i files at %.1f fps",
+                     path, self.total_frames, len(self.clips), self.fps)
+        self.frames = queue.Queue(maxsize=prefetch)
+        self.lock = Lock()
+        self.generation = 0      # bumped by seek() to discard queued frames
+        self.seek_to = 0         # frame number for the reader to go to
+        self.read_pos = -1       # frame number last returned by read_next
+        self.play_start = None   # monotonic time play_pos is shown at
+        self.play_pos = 0
+        self.stopped = False
+
+    def is_image(self, name):
+        """ return True if name is a still image rather than a video """
+        return os.path.splitext(name)[1].lower() in self.IMAGE_EXTS
+
+    def find_clips(self, path):
+        """
+        list [path, frame count, fps] for path or each file in it.  Images
+        are one frame at CAMERA_FRAMERATE, as are videos reporting no fps
+        """
+        if os.path.isdir(path):
+            paths = [os.path.join(path, name)
+                     for name in sorted(os.listdir(path))]
+            paths = [name for name in paths if os.path.isfile(name)]
+        else:
+            paths = [path]
+        clips = []
+        for name in paths:
+            if self.is_image(name):
+                clips.append([name, 1, CAMERA_FRAMERATE])
+                continue
+            video = cv2.VideoCapture(name)
+            frames = int(video.get(7))   # 7 = frame count
+            fps = video.get(5)           # 5 = frames per second
+            video.release()
+            if frames > 0:
+                clips.append([name, frames, fps if fps > 0 else CAMERA_FRAMERATE])
+            else:
+                logging.warning("Skipping %s No Video Frames Found", name)
+        return clips
+
+    def locate(self, position):
+        """ return (clip index, frame offset in clip) for a frame number """
+        for index, clip in enumerate(self.clips):
+            if position < clip[1]:
+                return index, position
+            position -= clip[1]
+        return None, 0
+
+    def start(self):
+        """ start the thread to read frames from the files """
         t = Thread(target=self.update, args=())
         t.daemon = True
         t.start()
         return self
 
+    def put(self, item):
+        """ queue item, waiting for space unless stopped or seeking """
+        while not self.stopped and item[0] == self.generation:
+            try:
+                self.frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
     def update(self):
-        """ keep looping infinitely until the thread is stopped """
+        """ decode frames into the prefetch queue until stopped """
+        video = None
+        video_clip = None   # clip index open in video
+        video_pos = None    # frame offset video will read next
+        position = 0
+        generation = -1
+        while not self.stopped:
+            with self.lock:
+                if self.seek_to is not None:
+                    position = self.seek_to
+                    self.seek_to = None
+                generation = self.generation
+            clip_index, offset = self.locate(position)
+            if clip_index is None:
+                self.put((generation, position, None))  # end of files
+                while (not self.stopped and self.seek_to is None):
+                    time.sleep(0.05)
+                continue
+            name = self.clips[clip_index][0]
+            if self.is_image(name):
+                frame = cv2.imread(name)
+            else:
+                if video_clip != clip_index or video_pos != offset:
+                    if video_clip != clip_index:
+                        if video is not None:
+                            video.release()
+                        video = cv2.VideoCapture(name)
+                        video_clip = clip_index
+                    video.set(1, offset)  # 1 = position in frames
+                grabbed, frame = video.read()
+                video_pos = offset + 1
+                if not grabbed:
+                    frame = None
+            if frame is None:
+                # frame count was an estimate or the file is unreadable
+                logging.warning("Could Not Read Frame %i of %s", offset, name)
+                position = sum(clip[1] for clip in self.clips[:clip_index + 1])
+                continue
+            if (frame.shape[1], frame.shape[0]) != self.resolution:
+                frame = cv2.resize(frame, self.resolution,
+                                   interpolation=cv2.INTER_AREA)
+            self.put((generation, position, frame))
+            position += 1
+        if video is not None:
+            video.release()
+
+    def read_next(self, timeout=None):
+        """
+        Return (frame, seq, frame_time) for the next frame in order.  seq is
+        the frame number plus one.  frame is None at the end of the files,
+        when eof is set, or if the reader did not keep up within timeout.
+        """
         while True:
-            # if the thread indicator variable is set, stop the thread
-            if self.stopped:
-                return
-            # otherwise, read the next frame from the webcam stream
-            (self.grabbed, self.frame) = self.webcam.read()
+            try:
+                generation, position, frame = self.frames.get(timeout=timeout)
+            except queue.Empty:
+                return None, self.read_seq, None
+            if generation == self.generation:
+                break
+        if frame is None:
+            self.eof = True
+            return None, self.read_seq, None
+        if self.play_start is None:
+            # time runs on from the last frame across a seek
+            self.play_start = monotonic()
+            if self.frame_time is not None:
+                self.play_start = max(self.play_start,
+                                      self.frame_time + 1.0 / self.fps)
+            self.play_pos = position
+        # frames are timed by where they are in the recording, so the
+        # tracker and the dark timer see the recorded speed however fast
+        # the files are read
+        frame_time = (self.play_start +
+                      (position - self.play_pos) / float(self.fps))
+        if not self.max_speed:
+            # hold frames back to play at the file frame rate
+            delay = frame_time - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.check_dark(frame, frame_time)
+        self.frame = frame
+        self.read_pos = position
+        self.frame_seq = self.read_seq = position + 1
+        self.frame_time = frame_time
+        return frame, self.frame_seq, frame_time
 
-    def read(self):
-        """ return the frame most recently read """
-        return self.frame
+    def dark_duration(self):
+        """ return seconds of recording the frames have been dark for """
+        dark_since = self.dark_since
+        if dark_since is None:
+            return 0.0
+        return self.frame_time - dark_since
+
+    def seek(self, position):
+        """ continue reading from frame number position """
+        position = max(0, min(int(position), self.total_frames))
+        with self.lock:
+            self.generation += 1
+            self.seek_to = position
+        self.eof = False
+        self.play_start = None
+        # drop anything queued before the seek
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                break
+
+    def tell(self):
+        """ return the frame number last returned by read_next """
+        return self.read_pos
+
+    def step(self, count=1, timeout=None):
+        """ read the frame count frames on from the last one, may be negative """
+        if count != 1:
+            self.seek(self.read_pos + count)
+        return self.read_next(timeout)
 
     def stop(self):
         """ indicate that the thread should be stopped """
         self.stopped = True
 
 #------------------------------------------------------------------------------
-def get_fps(start_time, frame_count):
-    """ Optional display of Video Stream frames per second """
-    if debug:
-        if frame_count >= FRAME_COUNTER:
-            duration = float(time.time() - start_time)
-            FPS = float(frame_count / duration)
-            logging.info("Processing at %.2f fps last %i frames",
-                         FPS, frame_count)
-            frame_count = 0
-            start_time = time.time()
+def make_detector(timer=None, detect_scale=DETECT_SCALE):
+    """ return a MotionDetector set up from the config.py settings """
+    return MotionDetector((IMAGE_W, IMAGE_H), timer=timer,
+                          detect_scale=detect_scale,
+                          blur_size=BLUR_SIZE,
+                          threshold=THRESHOLD_SENSITIVITY,
+                          min_area=MIN_AREA,
+                          dilate_iterations=DILATE_ITERATIONS,
+                          method=DETECT_METHOD, rois=DETECT_ROIS,
+                          exclude_polygons=EXCLUDE_POLYGONS,
+                          mask_image=MASK_IMAGE,
+                          gate_level=GATE_LEVEL, gate_scale=GATE_SCALE,
+                          gate_force=GATE_FORCE_FRAMES,
+                          max_objects=TRACK_MAX_OBJECTS if TRACK_OBJECTS else 1,
+                          max_change=EGO_MAX_CHANGE if EGO_MOTION else 0)
+
+
+def make_tracker():
+    """ return an ObjectTracker if TRACK_OBJECTS is on, otherwise None """
+    if not TRACK_OBJECTS:
+        return None
+    return ObjectTracker(max_distance=TRACK_MAX_DISTANCE,
+                         max_missed=TRACK_MAX_MISSED,
+                         min_hits=TRACK_MIN_HITS)
+
+#------------------------------------------------------------------------------
+class RateController(object):
+    """
+    Hold the time from frame capture to the end of processing it under
+    budget seconds.  When the smoothed latency runs over, quality is
+    lowered one step at a time, first skipping alternate frames, then
+    showing the window at camera size and last detecting at
+    RATE_DETECT_SCALE.  Steps are restored in reverse once latency drops
+    under restore * budget.  Changes are at least hold seconds apart.
+    """
+    def __init__(self, enabled=RATE_CONTROL, budget=LATENCY_BUDGET,
+                 restore=RATE_RESTORE, hold=RATE_HOLD_SEC):
+        self.budget = budget
+        self.restore = restore
+        self.hold = hold
+        # only offer the steps that would save something
+        self.steps = []
+        if enabled:
+            self.steps.append("skip alternate frames")
+            if window_on and WINDOW_BIGGER > 1:
+                self.steps.append("no window resize")
+            if RATE_DETECT_SCALE < DETECT_SCALE:
+                self.steps.append("detect scale %.2f" % RATE_DETECT_SCALE)
+        self.level = 0          # number of steps taken
+        self.latency = 0.0      # smoothed seconds from capture to processed
+        self.changed = monotonic()
+        self.skipped = False    # True if the last frame was skipped
+
+    def lowered(self, step):
+        """ return True if the quality step starting with step is taken """
+        for taken in self.steps[:self.level]:
+            if taken.startswith(step):
+                return True
+        return False
+
+    def skip_frame(self):
+        """ return True if this frame should not be processed """
+        if not self.level:
+            return False
+        self.skipped = not self.skipped
+        return self.skipped
+
+    def window_bigger(self):
+        """ WINDOW_BIGGER to use at the current quality """
+        if self.lowered("no window"):
+            return 1
+        return WINDOW_BIGGER
+
+    def detect_scale(self):
+        """ DETECT_SCALE to use at the current quality """
+        if self.lowered("detect scale"):
+            return RATE_DETECT_SCALE
+        return DETECT_SCALE
+
+    def update(self, frame_time):
+        """
+        Add the latency of a processed frame captured at frame_time and
+        return True if the quality level changed
+        """
+        if not self.steps:
+            return False
+        now = monotonic()
+        self.latency += 0.1 * (now - frame_time - self.latency)
+        if now - self.changed < self.hold:
+            return False
+        if self.latency > self.budget and self.level < len(self.steps):
+            self.level += 1
+            logging.info("Latency %.0f ms over %.0f ms budget, lowering"
+                         " quality: %s", self.latency * 1000,
+                         self.budget * 1000, self.steps[self.level - 1])
+        elif (self.latency < self.budget * self.restore and self.level):
+            self.level -= 1
+            logging.info("Latency %.0f ms under %.0f ms budget, restoring"
+                         " quality: %s", self.latency * 1000,
+                         self.budget * 1000, self.steps[self.level])
         else:
-            frame_count += 1
-    return start_time, frame_count
+            return False
+        self.changed = now
+        return True
+
+#------------------------------------------------------------------------------
+def flip_webcam(image):
+    """ apply WEBCAM_HFLIP and WEBCAM_VFLIP to a web camera frame """
+    if WEBCAM and not FILE_SOURCE:
+        if WEBCAM_HFLIP and WEBCAM_VFLIP:
+            image = cv2.flip(image, -1)
+        elif WEBCAM_HFLIP:
+            image = cv2.flip(image, 1)
+        elif WEBCAM_VFLIP:
+            image = cv2.flip(image, 0)
+    return image
+
+
+def motion_event(trace, c_xy, box, area, total_contours, target=None):
+    """
+    Queue a motion event for the config.py EVENT_SINKS.  trace is the
+    (frame_seq, capture_time, detect_time) of the frame and target the
+    tracked object followed, if any
+    """
+    frame_seq, frame_time = trace[:2]
+    (x, y, w, h) = box
+    event = {"time": round(time.time() - (monotonic() - frame_time), 4),
+             "seq": frame_seq,
+             "x": int(c_xy[0]), "y": int(c_xy[1]),
+             "box": [int(x), int(y), int(w), int(h)],
+             "area": int(area),
+             "contours": int(total_contours),
+             "object": None}
+    if target is not None:
+        event["object"] = target.id
+        event["velocity"] = [round(float(v), 1) for v in target.velocity]
+    events.emit(event)
+
+
+def report_motion(motion_box, total_contours, biggest_area, trace=None):
+    """ pass the centre of motion_box to motion_detected() and return it """
+    (x, y, w, h) = motion_box
+    c_xy = (int(x+w/2), int(y+h/2))   # centre of contour
+    motion_detected(c_xy, trace=trace) # Do Something here with motion data
+    if events.enabled and trace:
+        motion_event(trace, c_xy, motion_box, biggest_area, total_contours)
+    if debug:
+        motion_log.add("cxy(%i,%i) Contours:%i Largest:%ix%i=%i sqpx",
+                       c_xy[0], c_xy[1], total_contours,
+                       w, h, biggest_area)
+    return c_xy
+
+
+def follow_objects(tracker, boxes, areas, total_contours, frame_time,
+                   trace=None):
+    """
+    Add a frame's motion boxes to tracker and pan toward where the target
+    object will be by the time the stepper reacts.  Returns the target
+    and the x,y aimed at, or (None, None) if there is no target
+    """
+    tracker.update(boxes, areas, frame_time)
+    target = tracker.target()
+    if target is None:
+        return None, None
+    # allow for the age of the frame and the stepper reaction time.  A
+    # file source runs on its recorded timeline, not the clock
+    now = frame_time if FILE_SOURCE else monotonic()
+    aim = target.predict(now + TRACK_LEAD_SEC)
+    c_xy = (int(min(max(aim[0], 0), IMAGE_W - 1)),
+            int(min(max(aim[1], 0), IMAGE_H - 1)))
+    motion_detected(c_xy, trace=trace)
+    if events.enabled and trace:
+        # the event has where the target is, not where the stepper aims
+        motion_event(trace, target.position, target.box, target.area,
+                     total_contours, target)
+    if debug:
+        object_log.add("Object %i cxy(%i,%i) velocity %i,%i px/s age %.1fs"
+                       " Objects:%i Contours:%i", target.id, c_xy[0], c_xy[1],
+                       target.velocity[0], target.velocity[1], target.age(),
+                       len(tracker.objects), total_contours)
+    return target, c_xy
+
+
+def object_overlays(objects, target, c_xy):
+    """ overlays boxing and numbering each tracked object and the aim point """
+    overlays = []
+    for obj in objects:
+        (x, y, w, h) = obj.box
+        color = MO_COLOR if obj is target else CV_BLUE
+        overlays.append(("rectangle", ((x, y), (x+w, y+h), color, 1)))
+        overlays.append(("text", (str(obj.id), (x, max(y - 2, 8)),
+                                  cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)))
+    if target is not None:
+        overlays.append(("circle", (c_xy, CIRCLE_SIZE, MO_COLOR,
+                                    LINE_THICKNESS)))
+    return overlays
+
+
+def motion_overlays(motion_box, c_xy):
+    """ overlay of a small circle or rectangle at the motion location """
+    if motion_box is None:
+        return []
+    (x, y, w, h) = motion_box
+    if SHOW_CIRCLE:
+        return [("circle", (c_xy, CIRCLE_SIZE, MO_COLOR, LINE_THICKNESS))]
+    return [("rectangle", ((x, y), (x+w, y+h), MO_COLOR, LINE_THICKNESS))]
 
 #------------------------------------------------------------------------------
 def track():
     """ Process video stream images and report motion location """
-    image2 = vs.read()   # initialize image2 to create first grayimage
-    try:
-        grayimage1 = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
-    except:
-        vs.stop()
-        logging.error("Problem Connecting To Camera Stream.")
-        logging.error("Restarting Camera. One Moment Please ...")
-        time.sleep(4)
-        return
+    detector = make_detector(stage_timer)
+    # initialize image2 to create first grayimage
+    image2, frame_seq, frame_time = vs.read_next(FRAME_TIMEOUT)
+    while image2 is None:
+        if vs.eof:
+            logging.error("No Frames Found in %s", FILE_SOURCE)
+            return
+        # the watchdog keeps reopening the camera in the background
+        logging.warning("Waiting For Camera Stream ...")
+        image2, frame_seq, frame_time = vs.read_next(FRAME_TIMEOUT)
+    epoch = vs.read_epoch
+    detector.reset(flip_webcam(image2))
     if window_on:
         logging.info("Press q in window Quits")
     else:
@@ -390,137 +1403,508 @@ def track():
     logging.info("Start Motion Tracking ...")
     if not debug:
         logging.info("Note: Console Messages Suppressed per debug=%s", debug)
-    big_w = int(IMAGE_W * WINDOW_BIGGER)
-    big_h = int(IMAGE_H * WINDOW_BIGGER)
-    frame_count = 0  # initialize for get_fps
-    start_time = time.time() # initialize for get_fps
     still_scanning = True
 
-    black_frame_start_time = None
+    rate = RateController()
+    tracker = make_tracker()
+    pan_steps = None  # stepper position when the last frame was captured
     zeroed = False
-    total_black_time = 0
     while still_scanning:
-        # initialize variables
-        motion_found = False
-        biggest_area = MIN_AREA
-        image2 = vs.read()  # grab image
-        if WEBCAM:
-            if WEBCAM_HFLIP and WEBCAM_VFLIP:
-                image2 = cv2.flip(image2, -1)
-            elif WEBCAM_HFLIP:
-                image2 = cv2.flip(image2, 1)
-            elif WEBCAM_VFLIP:
-                image2 = cv2.flip(image2, 0)
-
-        # keep track of how long the image is black for
-        # if total sequential time is more than 5 seconds, return to zero position
-        if np.sum(image2) < 100000:
-            if not black_frame_start_time:
-                black_frame_start_time = time.time()
-            else:
-                total_black_time = time.time() - black_frame_start_time
+        # wait for a frame we have not processed yet
+        stage_timer.start()
+        image2, frame_seq, frame_time = vs.read_next(FRAME_TIMEOUT)
+        if image2 is None:
+            if vs.eof:
+                logging.info("End of %s after %i frames",
+                             FILE_SOURCE, frame_seq)
+                return
+            logging.warning("No new frame from camera in %.1f seconds",
+                            FRAME_TIMEOUT)
+            continue
+        stage_timer.lap("wait")
+        if rate.skip_frame():
+            continue
+        image2 = flip_webcam(image2)
+        settling = vs.settling()
+        if vs.read_epoch != epoch and not settling:
+            # the watchdog reopened the camera and its exposure has settled.
+            # Start differencing afresh but leave CURRENT_X, the stepper
+            # and the tracked objects
+            logging.info("Resuming Motion Tracking")
+            epoch = vs.read_epoch
+            detector.reset(image2)
+            pan_steps = None
+            continue
 
-            if total_black_time >= 3 and not zeroed:
+        # The capture thread flags black frames eg. lens cap on.  If they
+        # last BLACK_FRAME_ZERO_SEC seconds, return to the zero position
+        if vs.dark:
+            if not zeroed and vs.dark_duration() >= BLACK_FRAME_ZERO_SEC:
                 logging.info('Zeroing due to lens cap')
                 motion_detected((CAMERA_WIDTH/2, 0), force=True)
                 zeroed = True
             continue
         if zeroed:
-            logging.info(np.sum(image2))
-        # Since the image is not black, reset black counter and zero flag
+            logging.info("Frames no longer dark, level %.1f", vs.frame_level)
         zeroed = False
-        black_frame_start_time = None
-        total_black_time = 0
-
-        grayimage2 = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
-        if show_fps:
-            start_time, frame_count = get_fps(start_time, frame_count)
-        # Get differences between the two greyed images
-        difference_image = cv2.absdiff(grayimage1, grayimage2)
-        # save grayimage2 to grayimage1 ready for next image2
-        grayimage1 = grayimage2
-        difference_image = cv2.blur(difference_image, (BLUR_SIZE, BLUR_SIZE))
-        # Get threshold of difference image based on
-        # THRESHOLD_SENSITIVITY variable
-        retval, threshold_image = cv2.threshold(difference_image,
-                                                THRESHOLD_SENSITIVITY, 255,
-                                                cv2.THRESH_BINARY)
-        threshold_image = cv2.dilate(threshold_image, None, iterations=2)
+        if settling:
+            continue  # still adjusting to the light after a reopen
+
+        shift = None
+        if EGO_MOTION:
+            # panning by steps moves the scene steps / STEPS_PER_PIXEL
+            # pixels the other way, line the last frame up with this one
+            steps = stepper.position_at(frame_time)
+            if pan_steps is not None and (steps != pan_steps or
+                                          stepper.is_moving()):
+                shift = (float(pan_steps - steps) / STEPS_PER_PIXEL, 0)
+                if tracker:
+                    tracker.shift(shift)
+            pan_steps = steps
+        # the detector converts BGR frames into its own gray buffers
+        (total_contours, motion_box,
+         biggest_area) = detector.detect(image2, shift=shift)
+        detect_time = monotonic()
+        latency_tracer.frame_detected(frame_seq, frame_time, detect_time,
+                                      vs.frames_dropped)
+        target = c_xy = None  # nothing to draw unless motion is found
+        if tracker:
+            target, c_xy = follow_objects(tracker, detector.boxes,
+                                          detector.areas, total_contours,
+                                          frame_time,
+                                          (frame_seq, frame_time, detect_time))
+            stage_timer.lap("motor_cmd")
+        elif motion_box is not None:
+            c_xy = report_motion(motion_box, total_contours, biggest_area,
+                                 (frame_seq, frame_time, detect_time))
+            stage_timer.lap("motor_cmd")
+        # the display worker draws and shows frames on its own thread,
+        # skip the colour conversion if it is still busy with the last one
+        if display.wanted() and display.ready():
+            if tracker:
+                overlays = object_overlays(tracker.objects, target, c_xy)
+            else:
+                overlays = motion_overlays(motion_box, c_xy)
+            display.window_bigger = rate.window_bigger()
+            display.show(vs.to_bgr(image2), overlays,
+                         detector.difference_image, detector.threshold_image)
+            stage_timer.lap("display")
+        if display.quit:
+            vs.stop()
+            logging.info("End Motion Tracking")
+            sys.exit(0)
+        if (rate.update(frame_time) and
+                rate.detect_scale() != detector.scale):
+            # the new detector primes itself from the next frame
+            detector = make_detector(stage_timer, rate.detect_scale())
+        stage_timer.frame()
+        if show_fps and debug and stage_timer.frames % FRAME_COUNTER == 0:
+            stage_timer.log(vs.frames_dropped)
+            if GATE_LEVEL:
+                logging.info("Gate skipped full detection on %i frames",
+                             detector.gated)
+
+#------------------------------------------------------------------------------
+class StreamWatchdog:
+    """
+    Watch a camera stream for stalled, frozen or failing frames and reopen
+    the camera in the background, retrying with exponential backoff until
+    frames flow again.  Meanwhile track() just gets no new frames, so the
+    stepper holds its position and CURRENT_X is kept.
+    """
+    def __init__(self, vs, stall_sec=WATCHDOG_STALL_SEC,
+                 frozen_frames=WATCHDOG_FROZEN_FRAMES,
+                 invalid_frames=WATCHDOG_INVALID_FRAMES,
+                 backoff=WATCHDOG_BACKOFF, backoff_max=WATCHDOG_BACKOFF_MAX):
+        self.vs = vs
+        self.stall_sec = stall_sec
+        self.frozen_frames = frozen_frames
+        self.invalid_frames = invalid_frames
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.reconnects = 0
+
+    def start(self):
+        """ start the thread that watches the stream """
+        t = Thread(target=self.update, args=())
+        t.daemon = True
+        t.start()
+        return self
+
+    def problem(self):
+        """ return why the camera needs reopening, or None if it is fine """
+        vs = self.vs
+        if not vs.live:
+            return None  # a file source is never reopened
+        age = vs.last_frame_age()
+        if age > self.stall_sec:
+            return "no frame for %.1f seconds" % age
+        if vs.frozen_frames >= self.frozen_frames and not vs.dark:
+            return "%i identical frames" % vs.frozen_frames
+        if vs.invalid_frames >= self.invalid_frames:
+            return "%i failed reads" % vs.invalid_frames
+        return None
+
+    def update(self):
+        """ check the stream until it is stopped """
+        while not self.vs.stopped:
+            time.sleep(self.stall_sec / 4.0)
+            reason = self.problem()
+            if reason is not None and not self.vs.stopped:
+                logging.warning("Camera Stalled, %s. Reconnecting ...", reason)
+                self.recover()
+
+    def recover(self):
+        """ reopen the camera until it delivers frames again """
+        delay = self.backoff
+        attempt = 0
+        while not self.vs.stopped:
+            attempt += 1
+            if self.vs.reconnect() and self.frames_flowing():
+                self.reconnects += 1
+                logging.info("Camera Reconnected after %i attempts", attempt)
+                return
+            logging.warning("Camera Reconnect %i Failed, retry in %.1f seconds",
+                            attempt, delay)
+            time.sleep(delay)
+            delay = min(delay * 2, self.backoff_max)
+
+    def frames_flowing(self):
+        """ wait up to stall_sec for a frame from the reopened camera """
+        vs = self.vs
+        deadline = monotonic() + self.stall_sec
+        while monotonic() < deadline and not vs.stopped:
+            if vs.frame_epoch == vs.epoch:
+                return True
+            time.sleep(0.05)
+        return False
+
+#------------------------------------------------------------------------------
+def open_stream():
+    """
+    Save images to an in-program stream
+    Setup video stream on a processor Thread for faster speed
+    """
+    if FILE_SOURCE:
+        logging.info("Reading Frames From %s ...", FILE_SOURCE)
+        # every file frame is tracked from the first, there is no warm up
+        return FileVideoStream().start()
+    if WEBCAM:
+        logging.info("Initializing USB Web Camera ...")
+        vs = WebcamVideoStream().start()
+    else:
+        logging.info("Initializing Pi Camera ....")
+        vs = PiVideoStream(rotation=CAMERA_ROTATION, hflip=CAMERA_HFLIP,
+                           vflip=CAMERA_VFLIP).start()
+    # Start as soon as the exposure settles rather than after a fixed sleep
+    started = monotonic()
+    if vs.wait_ready():
+        logging.info("Camera ready after %.2f seconds", monotonic() - started)
+    else:
+        logging.warning("Camera not settled after %.1f seconds, starting anyway",
+                        READY_TIMEOUT)
+    if vs.live and WATCHDOG_STALL_SEC:
+        StreamWatchdog(vs).start()
+    return vs
+
+#------------------------------------------------------------------------------
+def pipeline_capture(ring, ready, stats, stop_event):
+    """ PIPELINE_MODE capture process, copy camera frames into free slots """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # parent handles ctrl-c
+    vs = open_stream()
+    slots = ring.views()
+    epoch = vs.read_epoch
+    try:
+        while not stop_event.is_set():
+            frame, frame_seq, frame_time = vs.read_next(FRAME_TIMEOUT)
+            if frame is None:
+                if vs.eof:
+                    ready.put(None)  # tell the detect process we are done
+                    return
+                continue
+            stats.captured.value += 1
+            # dark frames still go through so the lens cap zeroing works
+            settling = vs.settling()
+            if settling and not vs.dark:
+                continue  # a reopened camera is still adjusting to the light
+            try:
+                if vs.live:
+                    index = ring.free.get_nowait()
+                else:
+                    # a file source can wait for a slot, nothing is lost
+                    index = ring.free.get(timeout=FRAME_TIMEOUT)
+            except queue.Empty:
+                # every slot is still queued downstream so drop at source
+                stats.no_slot.value += 1
+                continue
+            slots[index][...] = flip_webcam(frame)
+            # the detect process starts afresh on a new epoch, only tell
+            # it once a reopened camera has settled
+            if not settling:
+                epoch = vs.read_epoch
+            ready.put((index, frame_seq, frame_time,
+                       vs.dark, vs.dark_duration(), epoch))
+    finally:
+        vs.stop()
+
+
+def pipeline_detect(ring, ready, results, stats, stop_event):
+    """ PIPELINE_MODE detection process, runs MotionDetector on new slots """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # parent handles ctrl-c
+    detector = make_detector()
+    detector_epoch = 0
+    slots = ring.views()
+    while not stop_event.is_set():
+        try:
+            item = ready.get(timeout=FRAME_TIMEOUT)
+        except queue.Empty:
+            continue
+        # only the newest frame matters, hand superseded ones straight back.
+        # Every frame of a file source is processed
+        while item is not None and not FILE_SOURCE:
+            try:
+                newer = ready.get_nowait()
+            except queue.Empty:
+                break
+            ring.free.put(item[0])
+            stats.superseded.value += 1
+            item = newer
+        if item is None:
+            results.put(None)  # end of the file source
+            return
+        index, frame_seq, frame_time, dark, dark_time, epoch = item
+        if epoch != detector_epoch:
+            # the camera was reopened and has settled, difference against
+            # its first steady frame
+            detector_epoch = epoch
+            detector.reset(slots[index])
+            results.put((index, frame_seq, frame_time, monotonic(), None,
+                         0, None, 0, [], []))
+            continue
+        if dark:
+            results.put((index, frame_seq, frame_time, None, dark_time,
+                         0, None, 0, None, None))
+            continue
+        # detect copies the slot into its own buffers so the parent can
+        # reuse the slot as soon as it is done with it
+        (total_contours, motion_box,
+         biggest_area) = detector.detect(slots[index])
+        results.put((index, frame_seq, frame_time, monotonic(), None,
+                     total_contours, motion_box, biggest_area,
+                     detector.boxes, detector.areas))
+
+
+class PipelineStats:
+    """ frame counters shared by the PIPELINE_MODE processes """
+    def __init__(self, mp):
+        # each counter is only written by one process
+        self.captured = mp.RawValue('L', 0)    # frames read from the camera
+        self.no_slot = mp.RawValue('L', 0)     # dropped, no free slot
+        self.superseded = mp.RawValue('L', 0)  # dropped, newer frame ready
+        self.processed = mp.RawValue('L', 0)   # results handled
+
+    def dropped(self):
+        """ total frames captured but never processed """
+        return self.no_slot.value + self.superseded.value
+
+    def log(self):
+        """ log the frame accounting """
+        logging.info("Pipeline frames captured:%i processed:%i"
+                     " dropped no slot:%i superseded:%i",
+                     self.captured.value, self.processed.value,
+                     self.no_slot.value, self.superseded.value)
+
+
+class FrameRing:
+    """
+    Frame slots in shared memory for PIPELINE_MODE.  Only slot numbers go
+    through the queues.  The capture process takes a slot from free and
+    the main process hands it back once it has finished with the frame.
+    """
+    def __init__(self, mp, shape, slots=PIPELINE_SLOTS):
+        self.shape = shape
+        size = 1
+        for dim in shape:
+            size *= dim
+        self.buffers = [mp.RawArray('B', size) for i in range(slots)]
+        self.free = mp.Queue()
+        for index in range(slots):
+            self.free.put(index)
+
+    def views(self):
+        """ numpy views of every slot, made in the process using them """
+        return [np.frombuffer(buf, dtype=np.uint8).reshape(self.shape)
+                for buf in self.buffers]
+
+
+class Pipeline:
+    """
+    PIPELINE_MODE runs capture and detection in their own processes so
+    they are not limited by the GIL, while this process moves the
+    stepper and shows the window.
+    """
+    def __init__(self):
         try:
-            contours, hierarchy = cv2.findContours(threshold_image,
-                                                   cv2.RETR_EXTERNAL,
-                                                   cv2.CHAIN_APPROX_SIMPLE)
-        except ValueError:
-            threshold_image, contours, hierarchy = cv2.findContours(threshold_image,
-                                                                    cv2.RETR_EXTERNAL,
-                                                                    cv2.CHAIN_APPROX_SIMPLE)
-        if contours:
-            total_contours = len(contours)  # Get total number of contours
-            largest_contour = None
-            for c in contours:              # find contour with biggest area
-                found_area = cv2.contourArea(c)  # get area of next contour
-                # find the middle of largest bounding rectangle
-                if found_area > biggest_area:
-                    motion_found = True
-                    biggest_area = found_area
-                    largest_contour = c
-            if motion_found:
-                (x, y, w, h) = cv2.boundingRect(largest_contour)
-                c_xy = (int(x+w/2), int(y+h/2))   # centre of contour
-                r_xy = (x, y) # Top left corner of rectangle
-                final_position = motion_detected(c_xy) # Do Something here with motion data
-                initial_position = final_position
-                if debug:
-                    logging.info("cxy(%i,%i) Contours:%i Largest:%ix%i=%i sqpx",
-                                 c_xy[0], c_xy[1], total_contours,
-                                 w, h, biggest_area)
-                if window_on:
-                # show small circle at motion location
-                    if SHOW_CIRCLE:
-                        cv2.circle(image2, c_xy, CIRCLE_SIZE,
-                                   MO_COLOR, LINE_THICKNESS)
-                    else:
-                        cv2.rectangle(image2, r_xy, (x+w, y+h),
-                                      MO_COLOR, LINE_THICKNESS)
-        if window_on:
-            if diff_window_on:
-                cv2.imshow('Difference Image', difference_image)
-            if thresh_window_on:
-                cv2.imshow('OpenCV Threshold', threshold_image)
-            # Note setting a bigger window will slow the FPS
-            if WINDOW_BIGGER > 1:
-                image2 = cv2.resize(image2, (big_w, big_h))
-            cv2.imshow('Press q in Window Quits)', image2)
-            # Close Window if q pressed while mouse over opencv gui window
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                cv2.destroyAllWindows()
-                vs.stop()
+            self.mp = multiprocessing.get_context("fork")
+        except AttributeError:  # python2 always forks
+            self.mp = multiprocessing
+        if WEBCAM or FILE_SOURCE or not CAMERA_LUMA:
+            shape = (IMAGE_H, IMAGE_W, 3)
+        else:
+            shape = (IMAGE_H, IMAGE_W)
+        self.ring = FrameRing(self.mp, shape)
+        self.ready = self.mp.Queue()
+        self.results = self.mp.Queue()
+        self.stats = PipelineStats(self.mp)
+        self.stop_event = self.mp.Event()
+        self.workers = []
+
+    def start(self):
+        """ fork the capture and detection processes """
+        self.workers = [
+            self.mp.Process(target=pipeline_capture, name="capture",
+                            args=(self.ring, self.ready, self.stats,
+                                  self.stop_event)),
+            self.mp.Process(target=pipeline_detect, name="detect",
+                            args=(self.ring, self.ready, self.results,
+                                  self.stats, self.stop_event))]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+        return self
+
+    def run(self):
+        """ act on detection results until q is pressed or a worker dies """
+        slots = self.ring.views()
+        tracker = make_tracker()
+        zeroed = False
+        logging.info("Start Pipeline Motion Tracking ...")
+        while True:
+            stage_timer.start()
+            try:
+                result = self.results.get(timeout=FRAME_TIMEOUT)
+            except queue.Empty:
+                dead = [w.name for w in self.workers if not w.is_alive()]
+                if dead:
+                    logging.error("Pipeline %s process stopped", dead)
+                    return
+                logging.warning("No detection results in %.1f seconds",
+                                FRAME_TIMEOUT)
+                continue
+            if result is None:
+                logging.info("End of %s", FILE_SOURCE)
+                return
+            (index, frame_seq, frame_time, detect_time, dark_time,
+             total_contours, motion_box, biggest_area, boxes, areas) = result
+            stage_timer.lap("wait")
+            self.stats.processed.value += 1
+            if dark_time is not None:
+                if not zeroed and dark_time >= BLACK_FRAME_ZERO_SEC:
+                    logging.info('Zeroing due to lens cap')
+                    motion_detected((CAMERA_WIDTH/2, 0), force=True)
+                    zeroed = True
+                self.ring.free.put(index)
+                continue
+            zeroed = False
+            latency_tracer.frame_detected(frame_seq, frame_time, detect_time,
+                                          self.stats.dropped())
+            target = c_xy = None  # nothing to draw unless motion is found
+            if tracker:
+                target, c_xy = follow_objects(tracker, boxes, areas,
+                                              total_contours, frame_time,
+                                              (frame_seq, frame_time,
+                                               detect_time))
+                stage_timer.lap("motor_cmd")
+            elif motion_box is not None:
+                c_xy = report_motion(motion_box, total_contours, biggest_area,
+                                     (frame_seq, frame_time, detect_time))
+                stage_timer.lap("motor_cmd")
+            if display.wanted() and display.ready():
+                image = slots[index]
+                if image.ndim == 2:
+                    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+                if tracker:
+                    overlays = object_overlays(tracker.objects, target, c_xy)
+                else:
+                    overlays = motion_overlays(motion_box, c_xy)
+                # difference and threshold images stay in the detect process
+                display.show(image, overlays)
+                stage_timer.lap("display")
+            quit_pressed = display.quit
+            self.ring.free.put(index)
+            stage_timer.frame()
+            if show_fps and debug and stage_timer.frames % FRAME_COUNTER == 0:
+                stage_timer.log(self.stats.dropped())
+            if quit_pressed:
                 logging.info("End Motion Tracking")
-                sys.exit(0)
+                return
+
+    def stop(self):
+        """ ask the workers to finish and wait for them """
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(2.0)
+            if worker.is_alive():
+                worker.terminate()
+        self.stats.log()
 
 #------------------------------------------------------------------------------
 if __name__ == '__main__':
-    while True:
-        """
-        Save images to an in-program stream
-        Setup video stream on a processor Thread for faster speed
-        """
-        try:
-            if WEBCAM:
-                logging.info("Initializing USB Web Camera ...")
-                vs = WebcamVideoStream().start()
-                time.sleep(4.0) # Allow WebCam time to initialize
-            else:
-                logging.info("Initializing Pi Camera ....")
-                vs = PiVideoStream().start()
-                vs.camera.rotation = CAMERA_ROTATION
-                vs.camera.hflip = CAMERA_HFLIP
-                vs.camera.vflip = CAMERA_VFLIP
-                time.sleep(2.0)  # Allow PiCamera time to initialize
+    startup = StartupTimer(STARTUP_TIME)
+    startup.record("imports", STARTUP_TIME)
+    pipeline = None
+    vs = None
+    if PIPELINE_MODE:
+        # fork the pipeline processes before starting any threads, they
+        # open the camera while this process carries on starting up
+        pipeline = startup.run("pipeline", lambda: Pipeline().start())
+    # log from a writer thread so slow consoles and SD cards do not stall
+    # tracking.  Pipeline processes keep logging directly.
+    log_listener = start_logging(LOG_QUEUE, LOG_REPEAT_SEC, LOG_FILE)
+    atexit.register(log_listener.stop)
+    motion_log = FrameSummary("detections", LOG_SUMMARY_SEC)
+    object_log = FrameSummary("target updates", LOG_SUMMARY_SEC)
+    # atexit runs these first, so the last summaries reach the log
+    atexit.register(motion_log.close)
+    atexit.register(object_log.close)
+    # connect to pigpiod and build the waves while the camera warms up
+    motor = startup.start("motor", connect_motor)
+    outputs_start = monotonic()
+    stage_timer = make_timer(STAGE_TIMING or show_fps, METRICS_WINDOW,
+                             METRICS_FILE, METRICS_INTERVAL, METRICS_PORT)
+    latency_tracer = make_tracer(LATENCY_TRACE, LATENCY_TRACE_FILE,
+                                 METRICS_WINDOW, FRAME_COUNTER)
+    streamer = make_streamer(STREAM_PORT, STREAM_HOST, STREAM_FPS,
+                             STREAM_QUALITY)
+    display = make_display('Press q in Window Quits)', window_on,
+                           WINDOW_BIGGER, diff_window_on, thresh_window_on,
+                           streamer)
+    events = make_event_stream(EVENT_SINKS, EVENT_QUEUE, EVENT_BATCH)
+    startup.record("outputs", outputs_start)
+    if not pipeline:
+        vs = startup.run("camera", open_stream)
+    motor.result()
+    stepper = StepperController().start()
+    startup.log()
+    try:
+        if pipeline:
+            pipeline.run()
+        else:
+            # track() returns at the end of a file source, the watchdog
+            # reopens a camera that stalls
             track()
-        except KeyboardInterrupt:
+    except KeyboardInterrupt:
+        print("")
+        logging.info("User Pressed Keyboard ctrl-c")
+    finally:
+        if vs:
             vs.stop()
-            print("")
-            logging.info("User Pressed Keyboard ctrl-c")
-            logging.info("Exiting %s %s", PROG_NAME, PROG_VER)
-            sys.exit(0)
+        if pipeline:
+            pipeline.stop()
+        stepper.stop()
+        display.stop()
+        streamer.stop()
+        events.close()
+        latency_tracer.close()
+    logging.info("Exiting %s %s", PROG_NAME, PROG_VER)
+    sys.exit(0)
@@ -0,0 +1,478 @@
+#!/usr/bin/env python
+
+"""
+motion_detector.py  part of motion-track
+Frame differencing motion detection used by motion-track.py and
+benchmark.py.  It only needs opencv and numpy so the detection stages
+can be run and timed without a camera or the pigpio daemon.
+"""
+
+import logging
+import math
+import numpy as np
+import cv2
+
+from stage_timer import NullTimer
+
+#------------------------------------------------------------------------------
+def detect_region(frame_size, detect_scale=1.0, rois=None,
+                  exclude_polygons=None, mask_image=None):
+    """
+    Work out where to look for motion in a frame_size (w, h) frame.
+    rois is a list of (x, y, w, h) rectangles, exclude_polygons a list of
+    [(x, y), ...] polygons and mask_image the path of an image whose black
+    pixels are ignored.  Returns the (x, y, w, h) box around the rois that
+    frames are cropped to, and a detect_scale sized mask of pixels in that
+    box to keep, or None if every pixel is kept.
+    """
+    image_w, image_h = frame_size
+    rois = rois or [(0, 0, image_w, image_h)]
+    x0 = max(0, min(x for x, y, w, h in rois))
+    y0 = max(0, min(y for x, y, w, h in rois))
+    x1 = min(image_w, max(x + w for x, y, w, h in rois))
+    y1 = min(image_h, max(y + h for x, y, w, h in rois))
+    roi = (x0, y0, x1 - x0, y1 - y0)
+    keep = np.zeros((image_h, image_w), dtype=np.uint8)
+    for x, y, w, h in rois:
+        keep[max(0, y):y+h, max(0, x):x+w] = 255
+    if exclude_polygons:
+        cv2.fillPoly(keep, [np.array(poly, dtype=np.int32)
+                            for poly in exclude_polygons], 0)
+    if mask_image:
+        mask = cv2.imread(mask_image, 0)  # 0 = load as grayscale
+        if mask is None:
+            logging.error("Could Not Read Mask Image %s", mask_image)
+        else:
+            mask = cv2.resize(mask, (image_w, image_h),
+                              interpolation=cv2.INTER_NEAREST)
+            keep[mask == 0] = 0
+    keep = keep[y0:y1, x0:x1]
+    if keep.all():
+        return roi, None
+    if detect_scale < 1:
+        keep = cv2.resize(keep, (int(roi[2] * detect_scale),
+                                 int(roi[3] * detect_scale)),
+                          interpolation=cv2.INTER_NEAREST)
+    logging.info("Detecting in x,y %i,%i %ix%i with %i%% masked out",
+                 roi[0], roi[1], roi[2], roi[3],
+                 100 - 100 * np.count_nonzero(keep) // keep.size)
+    return roi, keep
+
+NO_BOXES = np.zeros((0, 4), dtype=int)  # boxes when nothing moved
+NO_AREAS = np.zeros(0)
+
+#------------------------------------------------------------------------------
+def find_contours(threshold_image):
+    """ return the outer contours of threshold_image for any opencv version """
+    try:
+        contours, hierarchy = cv2.findContours(threshold_image,
+                                               cv2.RETR_EXTERNAL,
+                                               cv2.CHAIN_APPROX_SIMPLE)
+    except ValueError:
+        threshold_image, contours, hierarchy = cv2.findContours(threshold_image,
+                                                                cv2.RETR_EXTERNAL,
+                                                                cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+
+def largest_contour(threshold_image, min_area):
+    """
+    Find the contour with the biggest area above min_area.
+    Returns (total_contours, (x, y, w, h), area) with None for the
+    rectangle if no contour is big enough
+    """
+    contours = find_contours(threshold_image)
+    biggest_area = min_area
+    largest = None
+    for c in contours:              # find contour with biggest area
+        found_area = cv2.contourArea(c)  # get area of next contour
+        if found_area > biggest_area:
+            biggest_area = found_area
+            largest = c
+    if largest is None:
+        return len(contours), None, 0
+    return len(contours), cv2.boundingRect(largest), biggest_area
+
+
+def component_stats(threshold_image):
+    """
+    Label the blobs of threshold_image in one pass.
+    Returns numpy arrays of pixel areas, (x, y, w, h) boxes and (x, y)
+    centroids, one row per blob with the background removed
+    """
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(
+        threshold_image, connectivity=8)
+    return (stats[1:, cv2.CC_STAT_AREA],
+            stats[1:, :cv2.CC_STAT_AREA],
+            centroids[1:])
+
+
+def top_components(areas, count):
+    """ return indexes of the count biggest areas, biggest first """
+    if len(areas) > count:
+        index = np.argpartition(areas, -count)[-count:]
+    else:
+        index = np.arange(len(areas))
+    return index[np.argsort(areas[index])[::-1]]
+
+
+def largest_component(threshold_image, min_area):
+    """
+    connectedComponentsWithStats version of largest_contour().  Areas are
+    pixel counts so they run a little larger than contour areas.
+    """
+    areas, boxes, centroids = component_stats(threshold_image)
+    if not len(areas):
+        return 0, None, 0
+    biggest = int(np.argmax(areas))
+    if areas[biggest] <= min_area:
+        return len(areas), None, 0
+    return len(areas), tuple(int(v) for v in boxes[biggest]), int(areas[biggest])
+
+
+def all_contours(threshold_image, min_area, max_objects):
+    """
+    Find up to max_objects contours with areas above min_area.  Returns
+    (total_contours, boxes, areas) with an (x, y, w, h) row per contour,
+    biggest first
+    """
+    contours = find_contours(threshold_image)
+    areas = np.array([cv2.contourArea(c) for c in contours])
+    keep = np.nonzero(areas > min_area)[0]
+    if not len(keep):
+        return len(contours), NO_BOXES, NO_AREAS
+    index = keep[top_components(areas[keep], max_objects)]
+    boxes = np.array([cv2.boundingRect(contours[i]) for i in index])
+    return len(contours), boxes, areas[index]
+
+
+def all_components(threshold_image, min_area, max_objects):
+    """ connectedComponentsWithStats version of all_contours() """
+    areas, boxes, centroids = component_stats(threshold_image)
+    keep = np.nonzero(areas > min_area)[0]
+    if not len(keep):
+        return len(areas), NO_BOXES, NO_AREAS
+    index = keep[top_components(areas[keep], max_objects)]
+    return len(areas), boxes[index], areas[index]
+
+#------------------------------------------------------------------------------
+class MotionDetector:
+    """
+    Frame differencing motion detection.  Each full resolution gray or
+    BGR frame is cropped to the rois and scaled by detect_scale, then
+    differenced against the previous frame, blurred, thresholded, masked
+    and dilated before the largest moving blob is found.
+
+    Every intermediate image is allocated once for the frame size and
+    opencv writes into it with dst= so detect() makes no new arrays.
+    difference_image and threshold_image are overwritten by the next
+    detect() so copy them if they are needed for longer.
+
+    If gate_level is set each frame is first shrunk by gate_scale and
+    compared with the last fully processed frame.  The full pipeline only
+    runs when at least gate_level, a fraction of the small pixels not
+    masked out, changed by half the threshold, or every gate_force frames
+    so slow changes are not missed.  Being a fraction the level means the
+    same at any scale or roi.
+
+    detect() can be told how far the scene shifted since the last frame
+    eg. because the camera panned.  The last frame is shifted to line up
+    before differencing.  If more than max_change of the image still
+    changed the shift was wrong, so it is measured from the two images by
+    phase correlation and the difference done again.
+
+    With max_objects above 1 the boxes and areas of up to that many
+    blobs, biggest first, are kept in boxes and areas after each detect()
+    for ObjectTracker.
+    """
+    def __init__(self, frame_size, detect_scale=1.0, blur_size=10,
+                 threshold=25, min_area=200, dilate_iterations=2,
+                 method="contours", rois=None, exclude_polygons=None,
+                 mask_image=None, gate_level=0, gate_scale=0.125,
+                 gate_force=25, max_objects=1, max_change=0, timer=None):
+        self.frame_size = frame_size
+        self.timer = timer or NullTimer()  # times each stage of detect()
+        self.roi, self.mask = detect_region(frame_size, detect_scale, rois,
+                                            exclude_polygons, mask_image)
+        # blur_size and min_area are full resolution values so rescale
+        # them for the detect_scale images
+        self.scale = min(detect_scale, 1.0)
+        self.blur_size = max(1, int(round(blur_size * self.scale)))
+        self.min_area = min_area * self.scale * self.scale
+        self.threshold = threshold
+        self.dilate_iterations = dilate_iterations
+        self.max_objects = max_objects
+        self.max_change = max_change
+        self.shifts_measured = 0  # frames the shift had to be measured for
+        self.find_largest = largest_contour
+        self.find_all = all_contours
+        if method == "components":
+            if hasattr(cv2, "connectedComponentsWithStats"):
+                self.find_largest = largest_component
+                self.find_all = all_components
+            else:
+                logging.warning("OpenCV %s has no connectedComponentsWithStats"
+                                " using contours", cv2.__version__)
+        self.gate_level = gate_level
+        self.gate_scale = gate_scale
+        self.gate_force = gate_force
+        self.gate_score = 0.0    # fraction of gate pixels changed last frame
+        self.gated = 0           # frames the gate kept from the full pipeline
+        self.since_full = 0      # frames since the full pipeline last ran
+        self.frame_shape = None  # shape of the frames the buffers are for
+        self.primed = False      # True once grayimage1 holds a frame
+        self.difference_image = None
+        self.threshold_image = None
+        self.boxes = NO_BOXES    # max_objects > 1 blob boxes, biggest first
+        self.areas = NO_AREAS
+
+    def allocate(self, frame_shape):
+        """ make the detection buffers for frames of frame_shape """
+        x, y, w, h = self.roi
+        if self.scale < 1:
+            size = (int(h * self.scale), int(w * self.scale))
+        else:
+            size = (h, w)
+        self.frame_shape = frame_shape
+        self.detect_size = (size[1], size[0])
+        self.crop_gray = None
+        if len(frame_shape) == 3 and self.scale < 1:
+            # BGR frames are converted at roi size before scaling down
+            self.crop_gray = np.empty((h, w), dtype=np.uint8)
+        self.grayimage1 = np.empty(size, dtype=np.uint8)
+        self.grayimage2 = np.empty(size, dtype=np.uint8)
+        self.diff_buffer = np.empty(size, dtype=np.uint8)
+        self.blur_buffer = np.empty(size, dtype=np.uint8)
+        self.thresh_buffer = np.empty(size, dtype=np.uint8)
+        self.dilate_buffer = np.empty(size, dtype=np.uint8)
+        self.shift_buffer = np.empty(size, dtype=np.uint8)
+        self.shift_matrix = np.float32([[1, 0, 0], [0, 1, 0]])
+        if self.max_change:
+            self.float_image1 = np.empty(size, dtype=np.float32)
+            self.float_image2 = np.empty(size, dtype=np.float32)
+            self.window = cv2.createHanningWindow(self.detect_size,
+                                                  cv2.CV_32F)
+        if self.gate_level:
+            self.gate_size = (max(1, int(size[1] * self.gate_scale)),
+                              max(1, int(size[0] * self.gate_scale)))
+            gate_shape = (self.gate_size[1], self.gate_size[0])
+            self.gate_image1 = np.empty(gate_shape, dtype=np.uint8)
+            self.gate_image2 = np.empty(gate_shape, dtype=np.uint8)
+            self.gate_diff = np.empty(gate_shape, dtype=np.uint8)
+            self.gate_mask = None
+            if self.mask is not None:
+                # keep any gate pixel that covers some unmasked pixels
+                self.gate_mask = cv2.resize(self.mask, self.gate_size,
+                                            interpolation=cv2.INTER_AREA)
+                self.gate_mask[self.gate_mask > 0] = 255
+            # the pixels the gate watches, gate_level is a fraction of these
+            self.gate_pixels = self.gate_size[0] * self.gate_size[1]
+            if self.gate_mask is not None:
+                self.gate_pixels = max(1, cv2.countNonZero(self.gate_mask))
+        self.primed = False
+
+    def load(self, frame, gray):
+        """ crop, convert and scale a full resolution frame into gray """
+        x, y, w, h = self.roi
+        if w < self.frame_size[0] or h < self.frame_size[1]:
+            frame = frame[y:y+h, x:x+w]
+        if frame.ndim == 3:
+            if self.crop_gray is None:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+                return gray
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                                 dst=self.crop_gray)
+        if self.scale < 1:
+            cv2.resize(frame, self.detect_size, dst=gray,
+                       interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(gray, frame)
+        return gray
+
+    def reset(self, frame):
+        """ start differencing against a full resolution gray or BGR frame """
+        if frame.shape != self.frame_shape:
+            self.allocate(frame.shape)
+        self.load(frame, self.grayimage1)
+        self.prime_gate()
+        self.primed = True
+
+    def prime_gate(self):
+        """ make the gate compare against grayimage1 """
+        self.since_full = 0
+        if self.gate_level:
+            cv2.resize(self.grayimage1, self.gate_size, dst=self.gate_image1,
+                       interpolation=cv2.INTER_AREA)
+
+    def gate_open(self):
+        """
+        Return True if the full pipeline should run on grayimage2.  The
+        gate reference only moves on when it does, so slow changes add up
+        """
+        self.since_full += 1
+        cv2.resize(self.grayimage2, self.gate_size, dst=self.gate_image2,
+                   interpolation=cv2.INTER_AREA)
+        cv2.absdiff(self.gate_image1, self.gate_image2, dst=self.gate_diff)
+        cv2.threshold(self.gate_diff, self.threshold // 2, 255,
+                      cv2.THRESH_BINARY, dst=self.gate_diff)
+        if self.gate_mask is not None:
+            cv2.bitwise_and(self.gate_diff, self.gate_mask, dst=self.gate_diff)
+        self.gate_score = (cv2.countNonZero(self.gate_diff) /
+                           float(self.gate_pixels))
+        if (self.gate_score < self.gate_level and
+                self.since_full < self.gate_force):
+            self.gated += 1
+            return False
+        self.gate_image1, self.gate_image2 = self.gate_image2, self.gate_image1
+        self.since_full = 0
+        return True
+
+    def difference(self, shift_x=0.0, shift_y=0.0):
+        """
+        Threshold the difference between grayimage2 and grayimage1 shifted
+        by shift_x, shift_y detect image pixels into thresh_buffer
+        """
+        lap = self.timer.lap
+        previous = self.grayimage1
+        if shift_x or shift_y:
+            self.shift_matrix[0, 2] = shift_x
+            self.shift_matrix[1, 2] = shift_y
+            cv2.warpAffine(self.grayimage1, self.shift_matrix,
+                           self.detect_size, dst=self.shift_buffer,
+                           flags=cv2.INTER_LINEAR,
+                           borderMode=cv2.BORDER_REPLICATE)
+            previous = self.shift_buffer
+        # Get differences between the two greyed images
+        cv2.absdiff(previous, self.grayimage2, dst=self.diff_buffer)
+        lap("absdiff")
+        cv2.blur(self.diff_buffer, (self.blur_size, self.blur_size),
+                 dst=self.blur_buffer)
+        lap("blur")
+        # Get threshold of difference image based on threshold sensitivity
+        cv2.threshold(self.blur_buffer, self.threshold, 255,
+                      cv2.THRESH_BINARY, dst=self.thresh_buffer)
+        if self.mask is not None:
+            # drop motion outside the rois or inside excluded areas
+            cv2.bitwise_and(self.thresh_buffer, self.mask,
+                            dst=self.thresh_buffer)
+        if shift_x or shift_y:
+            # the edges the shift uncovered have nothing to compare with
+            h, w = self.thresh_buffer.shape
+            edge = int(math.ceil(abs(shift_x))) + self.blur_size // 2
+            if shift_x > 0:
+                self.thresh_buffer[:, :edge] = 0
+            elif shift_x < 0:
+                self.thresh_buffer[:, max(0, w - edge):] = 0
+            edge = int(math.ceil(abs(shift_y))) + self.blur_size // 2
+            if shift_y > 0:
+                self.thresh_buffer[:edge, :] = 0
+            elif shift_y < 0:
+                self.thresh_buffer[max(0, h - edge):, :] = 0
+        lap("threshold")
+
+    def measure_shift(self):
+        """ return the (x, y) shift from grayimage1 to grayimage2 """
+        np.copyto(self.float_image1, self.grayimage1)
+        np.copyto(self.float_image2, self.grayimage2)
+        shift = cv2.phaseCorrelate(self.float_image1, self.float_image2,
+                                   self.window)
+        if isinstance(shift[0], tuple):
+            shift = shift[0]  # opencv 3 and later add the peak response
+        shift_x, shift_y = shift
+        self.shifts_measured += 1
+        return shift_x, shift_y
+
+    def detect(self, frame, min_area=None, shift=None):
+        """
+        Find motion between a full resolution gray or BGR frame and the
+        last one.  min_area overrides the min_area the detector was made
+        with for this frame.  shift is the (x, y) frame pixels the scene
+        moved since the last frame, or None if the camera was still.
+        Returns (total_contours, (x, y, w, h), area) in frame coordinates
+        with None for the rectangle if nothing moved enough
+        """
+        lap = self.timer.lap
+        self.boxes = NO_BOXES
+        self.areas = NO_AREAS
+        if frame.shape != self.frame_shape:
+            self.allocate(frame.shape)
+        self.load(frame, self.grayimage2)
+        lap("gray")
+        if not self.primed:
+            self.grayimage1, self.grayimage2 = self.grayimage2, self.grayimage1
+            self.prime_gate()
+            self.primed = True
+            return 0, None, 0
+        shift_x = shift_y = 0.0
+        if shift is not None:
+            shift_x = shift[0] * self.scale
+            shift_y = shift[1] * self.scale
+            if abs(shift_x) < 0.5 and abs(shift_y) < 0.5:
+                shift_x = shift_y = 0.0
+        if self.gate_level and not (shift_x or shift_y):
+            gate_open = self.gate_open()
+            lap("gate")
+            if not gate_open:
+                # nothing much changed since the last full run, grayimage1
+                # stays as it is so slow changes still add up
+                return 0, None, 0
+        self.difference(shift_x, shift_y)
+        if (shift is not None and self.max_change and
+                cv2.countNonZero(self.thresh_buffer) >
+                self.max_change * self.thresh_buffer.size):
+            # the frames still do not line up, measure the shift instead
+            shift_x, shift_y = self.measure_shift()
+            lap("shift")
+            self.difference(shift_x, shift_y)
+        # swap so grayimage1 holds this frame ready for the next one
+        self.grayimage1, self.grayimage2 = self.grayimage2, self.grayimage1
+        if shift_x or shift_y:
+            self.prime_gate()  # the gate image is from before the pan
+        threshold_image = self.thresh_buffer
+        if self.dilate_iterations > 0:
+            threshold_image = cv2.dilate(self.thresh_buffer, None,
+                                         dst=self.dilate_buffer,
+                                         iterations=self.dilate_iterations)
+        lap("dilate")
+        self.difference_image = self.blur_buffer
+        self.threshold_image = threshold_image
+        if min_area is None:
+            min_area = self.min_area
+        else:
+            min_area = min_area * self.scale * self.scale
+        if self.max_objects > 1:
+            return self.detect_all(threshold_image, min_area)
+        (total_contours, motion_box,
+         biggest_area) = self.find_largest(threshold_image, min_area)
+        lap("contours")
+        if motion_box is None:
+            return total_contours, None, 0
+        (x, y, w, h) = motion_box
+        if self.scale < 1:
+            # back to full resolution frame coordinates
+            x = int(x / self.scale)
+            y = int(y / self.scale)
+            w = int(w / self.scale)
+            h = int(h / self.scale)
+            biggest_area = biggest_area / (self.scale * self.scale)
+        x += self.roi[0]  # detection ran on the cropped roi
+        y += self.roi[1]
+        return total_contours, (x, y, w, h), biggest_area
+
+    def detect_all(self, threshold_image, min_area):
+        """ detect() for max_objects > 1, fills in boxes and areas """
+        (total_contours, boxes,
+         areas) = self.find_all(threshold_image, min_area, self.max_objects)
+        self.timer.lap("contours")
+        if not len(boxes):
+            return total_contours, None, 0
+        if self.scale < 1:
+            # back to full resolution frame coordinates
+            boxes = boxes / self.scale
+            areas = areas / (self.scale * self.scale)
+        boxes = boxes.astype(int)
+        boxes[:, 0] += self.roi[0]  # detection ran on the cropped roi
+        boxes[:, 1] += self.roi[1]
+        self.boxes = boxes
+        self.areas = areas
+        return total_contours, tuple(int(v) for v in boxes[0]), areas[0]
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+motion_events.py  part of motion-track
+Structured motion events for other programs to consume.
+
+Each detection the tracker acts on becomes a dict with the wall clock
+time the frame was captured, its sequence number, the centre, bounding
+box and area of the motion, the contour count and the tracked object id
+if object tracking is on.  EventStream queues events without blocking
+and a worker thread delivers them in batches to any number of sinks,
+a JSON lines file, a UDP or unix datagram socket or a python callback.
+If the queue fills because a sink is slow events are counted and
+dropped, the tracker never waits.
+
+Sinks are given in config.py EVENT_SINKS as strings
+
+    "jsonl:motion-events.jsonl"   append a JSON line per event
+    "udp:127.0.0.1:5005"          send a JSON datagram per event
+    "unix:/tmp/motion-track.sock" send a JSON datagram per event
+    "python:my_module:on_events"  call my_module.on_events(events) with
+                                  each batch, a list of event dicts
+
+Code that makes its own EventStream can also add_sink(CallbackSink(f)).
+"""
+
+import importlib
+import json
+import logging
+import socket
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # python2
+
+#------------------------------------------------------------------------------
+class JsonLinesSink(object):
+    """ append events to a file as JSON lines """
+    def __init__(self, path):
+        self.name = "jsonl:%s" % path
+        self.events_file = open(path, "a")
+
+    def write(self, events):
+        for event in events:
+            self.events_file.write(json.dumps(event, sort_keys=True) + "\n")
+        self.events_file.flush()
+
+    def close(self):
+        self.events_file.close()
+
+
+class DatagramSink(object):
+    """
+    Send each event as a JSON datagram to a UDP (host, port) address or
+    a unix socket path.  Nobody listening is not an error, the datagrams
+    are just lost, and a full socket buffer drops events instead of
+    waiting.
+    """
+    def __init__(self, address):
+        if isinstance(address, tuple):
+            self.name = "udp:%s:%i" % address
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.name = "unix:%s" % address
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.address = address
+        self.lost = 0
+
+    def write(self, events):
+        for event in events:
+            try:
+                self.sock.sendto(json.dumps(event, sort_keys=True)
+                                 .encode("utf-8"), self.address)
+            except (IOError, OSError):
+                self.lost += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class CallbackSink(object):
+    """ call callback(events) with each batch, a list of event dicts """
+    def __init__(self, callback, name=None):
+        self.name = name or "callback:%s" % getattr(callback, "__name__",
+                                                    callback)
+        self.callback = callback
+
+    def write(self, events):
+        self.callback(events)
+
+    def close(self):
+        pass
+
+
+def make_sink(spec):
+    """ return the sink for a config.py EVENT_SINKS string """
+    kind, _, target = spec.partition(":")
+    if kind == "jsonl":
+        return JsonLinesSink(target)
+    if kind == "udp":
+        host, _, port = target.rpartition(":")
+        return DatagramSink((host, int(port)))
+    if kind == "unix":
+        return DatagramSink(target)
+    if kind == "python":
+        module_name, _, function = target.partition(":")
+        module = importlib.import_module(module_name)
+        return CallbackSink(getattr(module, function), spec)
+    raise ValueError("Unknown event sink %s" % spec)
+
+#------------------------------------------------------------------------------
+class NullEventStream(object):
+    """ EventStream stand in used when there are no sinks """
+    enabled = False
+
+    def emit(self, event):
+        pass
+
+    def close(self):
+        pass
+
+
+class EventStream(object):
+    """
+    Deliver events to sinks from a worker thread.  Up to batch_size
+    events already queued are handed to each sink in one write().  A
+    sink that raises is logged once and skipped for that batch.
+    """
+    enabled = True
+
+    def __init__(self, sinks=(), queue_size=1000, batch_size=50):
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.events = queue.Queue(maxsize=queue_size)
+        self.lost = 0           # events dropped because the queue was full
+        self.failed = set()     # names of sinks that have raised
+        self.worker = threading.Thread(target=self.update, args=())
+        self.worker.daemon = True
+        self.worker.start()
+
+    def add_sink(self, sink):
+        """ deliver events to sink as well, eg. a CallbackSink """
+        self.sinks = self.sinks + [sink]
+
+    def emit(self, event):
+        """ queue an event dict, never waits """
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.lost += 1
+
+    def update(self):
+        """ deliver batches of events until close() queues None """
+        closing = False
+        while not closing:
+            event = self.events.get()
+            if event is None:
+                break
+            batch = [event]
+            while len(batch) < self.batch_size:
+                try:
+                    event = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    closing = True
+                    break
+                batch.append(event)
+            for sink in self.sinks:
+                try:
+                    sink.write(batch)
+                except Exception as err:
+                    if sink.name not in self.failed:
+                        self.failed.add(sink.name)
+                        logging.error("Motion event sink %s failed: %s",
+                                      sink.name, err)
+
+    def close(self):
+        """ deliver the events already queued and close the sinks """
+        try:
+            self.events.put(None, timeout=1.0)
+        except queue.Full:
+            pass  # a sink is stuck, the join below gives up on it too
+        self.worker.join(5.0)
+        for sink in self.sinks:
+            sink.close()
+        if self.lost:
+            logging.warning("%i motion events dropped, sinks too slow",
+                            self.lost)
+
+
+def make_event_stream(sink_specs, queue_size=1000, batch_size=50):
+    """ return an EventStream for sink_specs, or a NullEventStream if none """
+    if not sink_specs:
+        return NullEventStream()
+    sinks = [make_sink(spec) for spec in sink_specs]
+    logging.info("Sending motion events to %s",
+                 ", ".join(sink.name for sink in sinks))
+    return EventStream(sinks, queue_size, batch_size)
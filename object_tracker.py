@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+object_tracker.py  part of motion-track
+Follow moving objects across frames.
+
+MotionDetector finds the moving blobs in each frame but has no idea
+which blob is which from one frame to the next.  ObjectTracker matches
+each frame's blob centres to where the objects it already knows about
+should be by now, so every object keeps the same id, and estimates the
+velocity of each with a constant velocity alpha-beta filter.  One object
+is picked as the target and kept until it is lost, so the pan stage does
+not jump between objects, and its position can be predicted ahead to
+allow for the time the stepper takes to react.
+"""
+
+import logging
+import numpy as np
+
+#------------------------------------------------------------------------------
+class TrackedObject(object):
+    """ an object seen in one or more frames, times are in seconds """
+    def __init__(self, object_id, box, area, now):
+        self.id = object_id
+        self.box = box
+        self.area = area
+        self.position = box_centre(box)
+        self.velocity = np.zeros(2)   # pixels per second
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1                 # frames the object was detected in
+        self.missed = 0               # frames since it was last detected
+
+    def age(self):
+        """ seconds since the object was first seen """
+        return self.last_seen - self.first_seen
+
+    def predict(self, when):
+        """ return the (x, y) position expected at time when """
+        return self.position + self.velocity * (when - self.last_seen)
+
+    def correct(self, box, area, now, alpha, beta):
+        """ move the estimate toward a new detection at time now """
+        elapsed = now - self.last_seen
+        predicted = self.predict(now)
+        residual = box_centre(box) - predicted
+        self.position = predicted + alpha * residual
+        if elapsed > 0:
+            self.velocity = self.velocity + beta * residual / elapsed
+        self.box = box
+        self.area = area
+        self.last_seen = now
+        self.hits += 1
+        self.missed = 0
+
+
+def box_centre(box):
+    """ return the centre of an (x, y, w, h) box as a float array """
+    x, y, w, h = box
+    return np.array([x + w / 2.0, y + h / 2.0])
+
+#------------------------------------------------------------------------------
+class ObjectTracker(object):
+    """
+    Match detections to tracked objects on centre distance.  A detection
+    more than max_distance pixels from every predicted position starts a
+    new object and objects undetected for more than max_missed frames are
+    dropped.  An object needs min_hits detections to become the target.
+    alpha and beta set how far the position and velocity follow each new
+    detection, lower values smooth more.
+    """
+    def __init__(self, max_distance=50, max_missed=10, min_hits=3,
+                 alpha=0.6, beta=0.2):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.alpha = alpha
+        self.beta = beta
+        self.objects = []
+        self.next_id = 1
+        self.target_id = None
+
+    def update(self, boxes, areas, now):
+        """
+        Add the (x, y, w, h) boxes and areas detected in a frame captured
+        at time now and return the list of tracked objects
+        """
+        matched = set()
+        if self.objects and len(boxes):
+            boxes = np.asarray(boxes, dtype=float)
+            centres = boxes[:, :2] + boxes[:, 2:] / 2.0
+            predicted = np.array([obj.predict(now) for obj in self.objects])
+            # distance from every predicted position to every detection
+            distance = np.hypot(predicted[:, 0, None] - centres[None, :, 0],
+                                predicted[:, 1, None] - centres[None, :, 1])
+            # greedily take the closest pairs first
+            used_objects = set()
+            for flat in np.argsort(distance, axis=None):
+                row, col = divmod(int(flat), distance.shape[1])
+                if distance[row, col] > self.max_distance:
+                    break
+                if row in used_objects or col in matched:
+                    continue
+                used_objects.add(row)
+                matched.add(col)
+                self.objects[row].correct(tuple(int(v) for v in boxes[col]),
+                                          areas[col], now,
+                                          self.alpha, self.beta)
+            for row, obj in enumerate(self.objects):
+                if row not in used_objects:
+                    obj.missed += 1
+        else:
+            for obj in self.objects:
+                obj.missed += 1
+        self.objects = [obj for obj in self.objects
+                        if obj.missed <= self.max_missed]
+        for col in range(len(boxes)):
+            if col not in matched:
+                box = tuple(int(v) for v in boxes[col])
+                self.objects.append(TrackedObject(self.next_id, box,
+                                                  areas[col], now))
+                self.next_id += 1
+        return self.objects
+
+    def shift(self, shift):
+        """ move every object by the (x, y) pixels the whole scene shifted """
+        for obj in self.objects:
+            obj.position = obj.position + shift
+            (x, y, w, h) = obj.box
+            obj.box = (int(x + shift[0]), int(y + shift[1]), w, h)
+
+    def target(self):
+        """
+        Return the object to follow, or None.  The current target is kept
+        while it is tracked, otherwise the biggest confirmed object is taken
+        """
+        confirmed = [obj for obj in self.objects if obj.hits >= self.min_hits]
+        for obj in confirmed:
+            if obj.id == self.target_id:
+                return obj
+        if not confirmed:
+            if self.target_id is not None:
+                logging.info("Lost target object %i", self.target_id)
+                self.target_id = None
+            return None
+        target = max(confirmed, key=lambda obj: obj.area)
+        logging.info("Following object %i at %i,%i", target.id,
+                     target.position[0], target.position[1])
+        self.target_id = target.id
+        return target
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+"""
+stage_timer.py  part of motion-track
+Low overhead timing of the motion-track processing stages.
+
+StageTimer keeps a rolling window of durations per stage and reports the
+p50/p95/p99 of each.  The timings can be logged, written to a JSON
+metrics file every few seconds or served in Prometheus text format on a
+local http port.  NullTimer has the same methods and does nothing so
+timing can be switched off without touching the code being timed.
+StartupTimer times the startup phases, some run in parallel on threads.
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic  # python2 has no monotonic clock
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:  # python2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+QUANTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+
+#------------------------------------------------------------------------------
+class NullTimer(object):
+    """ StageTimer stand in used when timing is off """
+    enabled = False
+    frames = 0
+
+    def start(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def record(self, stage, seconds):
+        pass
+
+    def frame(self):
+        pass
+
+
+class StageTimer(object):
+    """
+    Time stages with a monotonic clock.  start() marks the beginning of
+    a frame and each lap(stage) records the time since the last mark.
+    record() adds a duration measured elsewhere eg. on another thread.
+    """
+    enabled = True
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = {}     # stage: deque of the last window durations
+        self.totals = {}      # stage: [count, sum of seconds]
+        self.order = []       # stages in the order first seen
+        self.frames = 0
+        self.frame_times = deque(maxlen=window)
+        self.last = monotonic()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """ mark the start of a frame """
+        self.last = monotonic()
+
+    def lap(self, stage):
+        """ record the time since the last mark against stage """
+        now = monotonic()
+        self.record(stage, now - self.last)
+        self.last = now
+
+    def record(self, stage, seconds):
+        """ record a duration in seconds against stage """
+        samples = self.samples.get(stage)
+        if samples is None:
+            with self.lock:
+                samples = self.samples.setdefault(stage,
+                                                  deque(maxlen=self.window))
+                self.totals.setdefault(stage, [0, 0.0])
+                self.order.append(stage)
+        samples.append(seconds)
+        total = self.totals[stage]
+        total[0] += 1
+        total[1] += seconds
+
+    def frame(self):
+        """ count a processed frame """
+        self.frames += 1
+        self.frame_times.append(monotonic())
+
+    def fps(self):
+        """ frames per second over the rolling window """
+        times = list(self.frame_times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def summary(self):
+        """ return {stage: {count, mean, p50, p95, p99}} in seconds """
+        stats = {}
+        for stage in list(self.order):
+            values = sorted(self.samples[stage])
+            if not values:
+                continue
+            stage_stats = {"count": self.totals[stage][0],
+                           "mean": sum(values) / len(values)}
+            for name, quantile in QUANTILES:
+                stage_stats[name] = values[int(quantile * (len(values) - 1))]
+            stats[stage] = stage_stats
+        return stats
+
+    def log(self, frames_dropped=0):
+        """ log fps and the per stage p50/p95/p99 in milliseconds """
+        logging.info("Processing at %.2f fps %i frames (%i dropped)",
+                     self.fps(), self.frames, frames_dropped)
+        summary = self.summary()
+        for stage in self.order:
+            if stage in summary:
+                stats = summary[stage]
+                logging.info("  %-12s p50 %7.2f  p95 %7.2f  p99 %7.2f ms",
+                             stage, stats["p50"] * 1000,
+                             stats["p95"] * 1000, stats["p99"] * 1000)
+
+    def to_json(self):
+        """ return the timings as a JSON document """
+        return json.dumps({"fps": round(self.fps(), 2),
+                           "frames": self.frames,
+                           "stages": self.summary()},
+                          indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """ return the timings in Prometheus text exposition format """
+        lines = ["# HELP motion_track_fps Frames processed per second",
+                 "# TYPE motion_track_fps gauge",
+                 "motion_track_fps %.3f" % self.fps(),
+                 "# HELP motion_track_stage_seconds Time spent in each stage",
+                 "# TYPE motion_track_stage_seconds summary"]
+        summary = self.summary()
+        for stage in self.order:
+            if stage not in summary:
+                continue
+            for name, quantile in QUANTILES:
+                lines.append('motion_track_stage_seconds{stage="%s",'
+                             'quantile="%s"} %.6f'
+                             % (stage, quantile, summary[stage][name]))
+            count, total = self.totals[stage]
+            lines.append('motion_track_stage_seconds_sum{stage="%s"} %.6f'
+                         % (stage, total))
+            lines.append('motion_track_stage_seconds_count{stage="%s"} %i'
+                         % (stage, count))
+        return "\n".join(lines) + "\n"
+
+#------------------------------------------------------------------------------
+class MetricsWriter(object):
+    """ write a StageTimer to a JSON file every interval seconds """
+    def __init__(self, stage_timer, path, interval=10.0):
+        self.stage_timer = stage_timer
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def start(self):
+        """ start the thread that writes the metrics file """
+        t = threading.Thread(target=self.update, args=())
+        t.daemon = True
+        t.start()
+        return self
+
+    def update(self):
+        """ keep writing the file until the thread is stopped """
+        while not self.stopped.wait(self.interval):
+            try:
+                with open(self.path, "w") as f:
+                    f.write(self.stage_timer.to_json())
+            except (IOError, OSError) as err:
+                logging.error("Could Not Write Metrics File %s %s",
+                              self.path, err)
+
+    def stop(self):
+        """ indicate that the thread should be stopped """
+        self.stopped.set()
+
+
+class MetricsServer(object):
+    """ serve a StageTimer as Prometheus text on http://host:port/metrics """
+    def __init__(self, stage_timer, port, host="127.0.0.1"):
+        timer = stage_timer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = timer.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the console log
+
+        self.server = HTTPServer((host, port), Handler)
+
+    def start(self):
+        """ start the thread that serves metrics requests """
+        t = threading.Thread(target=self.server.serve_forever, args=())
+        t.daemon = True
+        t.start()
+        return self
+
+    def stop(self):
+        """ stop serving """
+        self.server.shutdown()
+
+
+def make_timer(enabled, window=1000, path=None, interval=10.0, port=0):
+    """
+    Return a StageTimer with its metrics file writer and http server
+    started as requested, or a NullTimer if enabled is False
+    """
+    if not enabled:
+        return NullTimer()
+    stage_timer = StageTimer(window)
+    if path:
+        MetricsWriter(stage_timer, path, interval).start()
+    if port:
+        MetricsServer(stage_timer, port).start()
+        logging.info("Stage timings at http://127.0.0.1:%i/metrics", port)
+    return stage_timer
+
+#------------------------------------------------------------------------------
+class StartupTask(threading.Thread):
+    """ run a startup phase on a thread, result() waits for its value """
+    def __init__(self, startup, name, func, args):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.startup = startup
+        self.func = func
+        self.args = args
+        self.value = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.value = self.startup.run(self.name, self.func, *self.args)
+        except Exception as err:
+            self.error = err
+
+    def result(self):
+        """ wait for the phase and return its value or raise its error """
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class StartupTimer(object):
+    """
+    Time the startup phases, which may overlap on different threads.
+    Times are seconds from started, the monotonic time the program began.
+    """
+    def __init__(self, started=None):
+        self.started = monotonic() if started is None else started
+        self.phases = []      # (name, start, end) as monotonic times
+        self.lock = threading.Lock()
+
+    def record(self, name, start, end=None):
+        """ record a phase that ran from start until end or now """
+        if end is None:
+            end = monotonic()
+        with self.lock:
+            self.phases.append((name, start, end))
+
+    def run(self, name, func, *args):
+        """ call func(*args) timing it as phase name """
+        start = monotonic()
+        try:
+            return func(*args)
+        finally:
+            self.record(name, start)
+
+    def start(self, name, func, *args):
+        """ start func(*args) on a thread as phase name, returns the task """
+        task = StartupTask(self, name, func, args)
+        task.start()
+        return task
+
+    def log(self):
+        """ log each phase with its start and duration, and the total """
+        logging.info("Startup took %.2fs", monotonic() - self.started)
+        for name, start, end in sorted(self.phases, key=lambda p: p[1]):
+            logging.info("  %-12s at %5.2fs took %5.2fs", name,
+                         start - self.started, end - start)